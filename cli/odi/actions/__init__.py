@@ -1 +1 @@
-from . import populate, prepare
+from . import merge, populate, prepare
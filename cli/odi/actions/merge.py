@@ -0,0 +1,96 @@
+import os
+import sys
+import shutil
+import filecmp
+
+
+class OverlapError(Exception):
+    """The destination of a merge is, holds or is inside one of the sources.
+    """
+
+
+def run(sources, destination, clean_slate=False):
+    """Merge the output trees of sharded builds into `destination`.
+
+    Each place page is built by exactly one shard, while everything else
+    (the overviews, the API, static pages and theme files) is built by
+    every shard, or by the first one only. Files found in several sources
+    are copied from the first, and the ones whose content differs are
+    returned as conflicts.
+    Files already in `destination` that no source has are kept, and
+    returned as stale, unless `clean_slate` removes it all first.
+    Returns the counts of files copied and skipped, the conflicts and the
+    stale files, as byte strings.
+    """
+
+    # Paths are walked as byte strings, so that names like alias
+    # directories are copied as they are, whatever their encoding
+    sources = [encode_path(source) for source in sources]
+    destination = encode_path(destination)
+
+    check_overlap(sources, destination)
+    if clean_slate and os.path.isdir(destination):
+        shutil.rmtree(destination)
+
+    counts = dict.fromkeys(('copied', 'skipped'), 0)
+    conflicts = []
+
+    # the first source each file was copied from, by relative path
+    copied = {}
+
+    for source in sources:
+        for dirpath, dirnames, filenames in os.walk(source):
+            reldir = os.path.relpath(dirpath, source)
+            target_dir = os.path.normpath(os.path.join(destination, reldir))
+            if not os.path.isdir(target_dir):
+                os.makedirs(target_dir)
+
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                relpath = os.path.normpath(os.path.join(reldir, filename))
+
+                if relpath in copied:
+                    counts['skipped'] += 1
+                    if not filecmp.cmp(copied[relpath], filepath,
+                                       shallow=False):
+                        conflicts.append(relpath)
+                    continue
+
+                shutil.copy2(filepath, os.path.join(target_dir, filename))
+                copied[relpath] = filepath
+                counts['copied'] += 1
+
+    stale = []
+    for dirpath, dirnames, filenames in os.walk(destination):
+        reldir = os.path.relpath(dirpath, destination)
+        for filename in filenames:
+            relpath = os.path.normpath(os.path.join(reldir, filename))
+            if relpath not in copied:
+                stale.append(relpath)
+
+    return counts, sorted(conflicts), sorted(stale)
+
+
+def encode_path(path):
+    """Return `path` as a byte string, in the filesystem encoding.
+    """
+
+    if isinstance(path, unicode):
+        return path.encode(sys.getfilesystemencoding() or 'utf-8')
+    return path
+
+
+def check_overlap(sources, destination):
+    """Raise OverlapError if `destination` is, or holds, one of `sources`.
+
+    Merging would then copy files onto themselves, or into a tree that is
+    still being read.
+    """
+
+    target = os.path.realpath(destination)
+    for source in sources:
+        path = os.path.realpath(source)
+        if (path == target or path.startswith(target + os.sep) or
+                target.startswith(path + os.sep)):
+            raise OverlapError('Cannot merge {0} into {1}, they overlap'.format(
+                source, destination))
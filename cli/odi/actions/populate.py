@@ -3,10 +3,17 @@ import sys
 import codecs
 import shutil
 import logging
+from multiprocessing.pool import ThreadPool
 
 
-def run(limited_places=None, limited_datasets=None):
-    Populate(limited_places=limited_places, limited_datasets=limited_datasets)
+def run(limited_places=None, limited_datasets=None, clean_slate=False,
+        shard=None):
+    """Populate the page sources, and return the counts of files changed."""
+
+    populate = Populate(limited_places=limited_places,
+                        limited_datasets=limited_datasets,
+                        clean_slate=clean_slate, shard=shard)
+    return populate.counts
 
 
 class Populate(object):
@@ -21,6 +28,7 @@ class Populate(object):
         sys.path.append(CONF)
 
         import datastore
+        import datastore_pages
         import config_default
         self.conf = {
             'DATASTORE': config_default.DATASTORE,
@@ -32,15 +40,13 @@ class Populate(object):
         self.dest_path = os.path.join(PROJECT_ROOT, 'content', 'pages')
         self.datasets_dir = os.path.join(self.dest_path, 'dataset')
         self.places_dir = os.path.join(self.dest_path, 'place')
-        self.file = 'index.md'
-        self.empty_display_type = u'empty'
-        self.na_display_type = u'na'
         self.datastore = ds.build()
-        self.places = self.datastore['places'].dict
-        self.datasets = self.datastore['datasets'].dict
-        self.entries = self.datastore['entries'].dict
+        self.places = self.datastore['places'].rows
+        self.datasets = self.datastore['datasets'].rows
+        self.entries = self.datastore['entries'].rows
         self.years = self.conf['ODI']['years']
         self.current_year = self.conf['ODI']['current_year']
+        self.workers = self.conf['ODI'].get('populate_workers', 1)
 
         if kwargs.get('limited_places'):
             self.places = [p for p in self.places if
@@ -50,337 +56,89 @@ class Populate(object):
             self.datasets = [d for d in self.datasets if
                            d['id'] in kwargs['limited_datasets']]
 
-        self.ensure_dir(self.datasets_dir, clean_slate=True)
-        self.ensure_dir(self.places_dir, clean_slate=True)
-
-        self.write_places()
-        self.write_datasets()
-
-    def commit_file(self, filepath, filetemplate, filecontext):
-        with open(filepath, 'w+') as f:
-            f.write(filetemplate.format(**filecontext).encode('utf-8'))
+        # only the places of one shard, like `3/8`, and the shared pages
+        # if it is the first
+        shard = datastore_pages.parse_shard(kwargs.get('shard'))
+        if shard:
+            self.places = [p for p in self.places if
+                           datastore_pages.in_shard(p['id'], shard)]
+
+        # page sources to write, by path
+        self.pages = {}
+        for path, source in datastore_pages.page_sources(
+                self.places, self.datasets, self.entries, self.years,
+                self.current_year, shared=datastore_pages.is_shared(shard)):
+            filepath = os.path.join(self.dest_path, path)
+            self.pages[filepath] = source.encode('utf-8')
+
+        clean_slate = kwargs.get('clean_slate', False)
+        self.ensure_dir(self.datasets_dir, clean_slate=clean_slate)
+        self.ensure_dir(self.places_dir, clean_slate=clean_slate)
+
+        self.counts = self.sync()
+
+    def sync(self):
+        """Bring the page sources on disk in line with `self.pages`.
+
+        Only files whose bytes differ are written, so unchanged pages keep
+        their mtime, and only pages that are no longer wanted are removed.
+        The directory tree is created up front, then files are compared
+        and written by a pool of ODI['populate_workers'] threads.
+        Returns counts of the files created, updated, removed and left
+        unchanged.
+        """
+
+        counts = dict.fromkeys(('created', 'updated', 'removed',
+                                'unchanged'), 0)
+
+        for dirpath in sorted(set(os.path.dirname(filepath) for
+                                  filepath in self.pages)):
+            if not os.path.isdir(dirpath):
+                os.makedirs(dirpath)
+
+        pool = ThreadPool(max(self.workers, 1))
+        try:
+            results = pool.map(self.sync_file, self.pages.iteritems(),
+                               chunksize=64)
+        finally:
+            pool.close()
+            pool.join()
+
+        for result in results:
+            counts[result] += 1
+
+        for root in (self.datasets_dir, self.places_dir):
+            for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+                for filename in filenames:
+                    filepath = os.path.join(dirpath, filename)
+                    if filepath not in self.pages:
+                        os.remove(filepath)
+                        counts['removed'] += 1
+                if dirpath != root and not os.listdir(dirpath):
+                    os.rmdir(dirpath)
+
+        return counts
+
+    def sync_file(self, page):
+        """Write one (filepath, content) page if it changed, see sync."""
+
+        filepath, content = page
+
+        try:
+            with open(filepath, 'rb') as f:
+                if f.read() == content:
+                    return 'unchanged'
+            result = 'updated'
+        except IOError:
+            result = 'created'
+
+        with open(filepath, 'wb') as f:
+            f.write(content)
+
+        return result
 
     def ensure_dir(self, dirpath, clean_slate=False):
         if clean_slate and os.path.exists(dirpath):
             shutil.rmtree(dirpath)
         if not os.path.exists(dirpath):
             os.makedirs(dirpath)
-
-    def write_datasets(self):
-        """Write source files for datasets."""
-
-        # set the default display_type
-        display_type = u'datasets'
-
-        # write the datasets overview
-        filepath = os.path.join(self.datasets_dir, self.file)
-        filecontext = {
-            'year': self.current_year,
-            'display_type': display_type
-        }
-        self.commit_file(filepath, dataset_overview_template, filecontext)
-
-        # write the historical overviews
-        for year in self.years:
-            if year != self.current_year:
-
-                # ensure this datasets/year directory exists
-                dirpath = os.path.join(self.datasets_dir, year)
-                self.ensure_dir(dirpath)
-
-                # write this datasets/year index file
-                filepath = os.path.join(dirpath, self.file)
-                filecontext = {
-                    'year': year,
-                    'display_type': display_type
-                }
-                self.commit_file(filepath, dataset_overview_historical_template, filecontext)
-
-        # write files per dataset
-        for dataset in self.datasets:
-
-            # set the default display_type
-            display_type = u'dataset'
-
-            # ensure this dataset's directory exists
-            dirpath = os.path.join(self.datasets_dir, dataset['id'])
-            self.ensure_dir(dirpath)
-
-            # write the dataset index file for the current year
-            filepath = os.path.join(dirpath, self.file)
-            filecontext = {
-                'dataset_name': dataset['title'],
-                'dataset_slug': dataset['id'],
-                'year': self.current_year,
-                'display_type': display_type
-            }
-            self.commit_file(filepath, dataset_template, filecontext)
-
-            # write the dataset index file for other years
-            for year in self.years:
-                if year != self.current_year:
-
-                    # ensure this dataset/year directory exists
-                    dirpath = os.path.join(self.datasets_dir, dataset['id'],
-                                           year)
-                    self.ensure_dir(dirpath)
-
-                    # write this dataset/year index file
-                    filepath = os.path.join(dirpath, self.file)
-                    filecontext = {
-                        'dataset_name': dataset['title'],
-                        'dataset_slug': dataset['id'],
-                        'year': year,
-                        'display_type': display_type
-                    }
-                    self.commit_file(filepath, dataset_historical_template,
-                                     filecontext)
-
-    def write_places(self):
-        """Write source files for places."""
-
-        # set the default display_type
-        display_type = u'places'
-
-        # write the places overview
-        filepath = os.path.join(self.places_dir, self.file)
-        filecontext = {
-            'year': self.current_year,
-            'display_type': display_type
-        }
-        self.commit_file(filepath, place_overview_template, filecontext)
-
-        # write the historical overviews
-        for year in self.years:
-            if year != self.current_year:
-
-                # ensure this places/year directory exists
-                dirpath = os.path.join(self.places_dir, year)
-                self.ensure_dir(dirpath)
-
-                # write this places/year index file
-                filepath = os.path.join(dirpath, self.file)
-                filecontext = {
-                    'year': year,
-                    'display_type': display_type
-                }
-                self.commit_file(filepath, place_overview_historical_template, filecontext)
-
-        # write files per place
-        for place in self.places:
-
-            # set the default display_type
-            display_type = u'place'
-
-            # the display type depends on the presence
-            # of entries in the current year
-            entries = [e for e in self.entries if
-                       e['place'] == place['id'] and
-                       e['year'] == self.current_year]
-
-            if not entries:
-                display_type = self.empty_display_type
-
-            # ensure this place's directory exists
-            dirpath = os.path.join(self.places_dir, place['id'])
-            self.ensure_dir(dirpath)
-
-            # write the place index file for the current year
-            filepath = os.path.join(dirpath, self.file)
-            filecontext = {
-                'place_name': place['name'],
-                'place_encname': place['name'].replace(',', '').replace(' ', '%20'),
-                'place_id': place['id'],
-                'place_slug': place['slug'],
-                'year': self.current_year,
-                'display_type': display_type
-            }
-            self.commit_file(filepath, place_template, filecontext)
-
-            # write the place index file for other years
-            for year in self.years:
-                if year != self.current_year:
-
-                    # the display type depends on the presence of entries
-                    entries = [e for e in self.entries if
-                               e['place'] == place['id'] and
-                               e['year'] == year]
-
-                    if not entries:
-                        display_type = self.na_display_type
-
-                    # ensure this place/year directory exists
-                    dirpath = os.path.join(self.places_dir, place['id'], year)
-                    self.ensure_dir(dirpath)
-
-                    # write this place/year index file
-                    filepath = os.path.join(dirpath, self.file)
-                    filecontext = {
-                        'place_name': place['name'],
-                        'place_id': place['id'],
-                        'place_slug': place['slug'],
-                        'year': year,
-                        'display_type': display_type
-                    }
-                    self.commit_file(filepath, place_historical_template,
-                                     filecontext)
-
-            # write place/dataset files
-            for dataset in self.datasets:
-
-                # set the default display_type
-                display_type = u'place_dataset'
-
-                # the display type depends on the presence of entries
-                entries = [e for e in self.entries if
-                           e['place'] == place['id'] and
-                           e['dataset'] == dataset['id'] and
-                           e['year'] == self.current_year]
-
-                if not entries:
-                    display_type = self.empty_display_type
-
-                # ensure this place/dataset directory exists
-                dirpath = os.path.join(self.places_dir, place['id'],
-                                       dataset['id'])
-                self.ensure_dir(dirpath)
-
-                # write the place/dataset index file for the current year
-                filepath = os.path.join(dirpath, self.file)
-                filecontext = {
-                    'place_name': place['name'],
-                    'place_encname': place['name'].replace(',', '').replace(' ', '%20'),
-                    'place_id': place['id'],
-                    'place_slug': place['slug'],
-                    'dataset_name': dataset['title'],
-                    'dataset_id': dataset['id'],
-                    'year': self.current_year,
-                    'display_type': display_type
-                }
-                self.commit_file(filepath, place_dataset_template, filecontext)
-
-                # write the place/dataset index file for other years
-                for year in self.years:
-                    if year != self.current_year:
-
-                        # the display type depends on the presence of entries
-                        entries = [e for e in self.entries if
-                                   e['place'] == place['id'] and
-                                   e['dataset'] == dataset['id'] and
-                                   e['year'] == year]
-
-                        if not entries:
-                            display_type = self.na_display_type
-
-                        # ensure this place/dataset/year directory exists
-                        dirpath = os.path.join(dirpath, year)
-                        self.ensure_dir(dirpath)
-
-                        # write this place/dataset/year index file
-                        filepath = os.path.join(dirpath, self.file)
-                        filecontext = {
-                            'place_name': place['name'],
-                            'place_id': place['id'],
-                            'place_slug': place['slug'],
-                            'dataset_name': dataset['title'],
-                            'dataset_id': dataset['id'],
-                            'year': year,
-                            'display_type': display_type
-                        }
-                        self.commit_file(filepath,
-                                         place_dataset_historical_template,
-                                         filecontext)
-
-
-place_overview_template = u"""type: {display_type}
-template: {display_type}
-title: Place overview
-slug: place
-year: {year}
-alias: /country/
-"""
-
-
-place_overview_historical_template = u"""type: {display_type}
-template: {display_type}
-title: Place overview {year}
-slug: place/{year}
-year: {year}
-"""
-
-
-dataset_overview_template = u"""type: {display_type}
-template: {display_type}
-title: Dataset overview
-slug: dataset
-year: {year}
-"""
-
-
-dataset_overview_historical_template = u"""type: {display_type}
-template: {display_type}
-title: Dataset overview {year}
-slug: dataset/{year}
-year: {year}
-"""
-
-
-place_template = u"""type: {display_type}
-template: {display_type}
-title: {place_name}
-slug: place/{place_slug}
-place: {place_id}
-year: {year}
-alias: /country/overview/{place_encname}/
-"""
-
-
-place_historical_template = u"""type: {display_type}
-template: {display_type}
-title: {place_name}
-slug: place/{place_slug}/{year}
-place: {place_id}
-year: {year}
-"""
-
-
-place_dataset_template = u"""type: {display_type}
-template: {display_type}
-title: {place_name} / {dataset_name}
-slug: place/{place_slug}/{dataset_id}
-place: {place_id}
-dataset: {dataset_id}
-year: {year}
-fast: true
-alias: /country/overview/{place_encname}/{dataset_id}/
-"""
-
-
-place_dataset_historical_template = u"""type: {display_type}
-template: {display_type}
-title: {place_name} / {dataset_name} ({year})
-slug: place/{place_slug}/{dataset_id}/{year}
-place: {place_id}
-dataset: {dataset_id}
-year: {year}
-fast: true
-"""
-
-
-dataset_template = u"""type: {display_type}
-template: {display_type}
-title: {dataset_name}
-slug: dataset/{dataset_slug}
-dataset: {dataset_slug}
-year: {year}
-alias: /country/dataset/{dataset_slug}/
-"""
-
-
-dataset_historical_template = u"""type: {display_type}
-template: {display_type}
-title: {dataset_name}
-slug: dataset/{dataset_slug}/{year}
-dataset: {dataset_slug}
-year: {year}
-"""
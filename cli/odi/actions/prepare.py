@@ -4,22 +4,24 @@ config = services.config.get_config()
 
 # Interface
 
-def run():
-    print('Preparing datasets...')
-    datasets = Datasets()
-    datasets.run()
-    print('Preparing entries...')
-    entries = Entries()
-    entries.run()
-    print('Preparing questions...')
-    questions = Questions()
-    questions.run()
-    print('Preparing places...')
-    places = Places()
-    places.run()
-    print('Preparing summary...')
-    summary = Summary()
-    summary.run()
+def run(offline=False):
+    services.data.offline = offline
+    print('Fetching data...')
+    services.data.load_many(get_wanted())
+    for stage in STAGES:
+        print('Preparing {0}...'.format(stage.entity))
+        stage().run()
+
+
+def get_wanted():
+    """Return the (entity, year, exclude) items that the stages load.
+    """
+    wanted = []
+    for stage in STAGES:
+        for item in stage.get_wanted():
+            if item not in wanted:
+                wanted.append(item)
+    return wanted
 
 
 # Implement
@@ -72,6 +74,13 @@ class Datasets(object):
         # Save items as csv
         services.data.save_items(self.entity, self.fieldnames, items)
 
+    @classmethod
+    def get_wanted(cls):
+        """Return the (entity, year, exclude) items that run loads.
+        """
+        return (services.data.get_history_wanted(cls.entity) +
+                [(cls.entity, config.ODI['current_year'], False)])
+
 
 class Entries(object):
 
@@ -114,8 +123,9 @@ class Entries(object):
 
         # Get items
         items = []
-        for year in config.ODI['years']:
-            year_items = services.data.load_items(self.entity, year=year)
+        for entity, year, exclude in self.get_wanted():
+            year_items = services.data.load_items(
+                entity, year=year, exclude=exclude)
             for item in year_items:
                 item[year] = year
             items.extend(year_items)
@@ -142,6 +152,12 @@ class Entries(object):
         # Save items as csv
         services.data.save_items(self.entity, self.fieldnames, items)
 
+    @classmethod
+    def get_wanted(cls):
+        """Return the (entity, year, exclude) items that run loads.
+        """
+        return services.data.get_history_wanted(cls.entity)
+
     @classmethod
     def get_submitters_and_reviewers(cls):
         """Return submitters and reviwers indexed by place.
@@ -221,6 +237,12 @@ class Questions(object):
         # Save items as csv
         services.data.save_items(self.entity, self.fieldnames, items)
 
+    @classmethod
+    def get_wanted(cls):
+        """Return the (entity, year, exclude) items that run loads.
+        """
+        return [(cls.entity, config.ODI['current_year'], True)]
+
 
 class Places(object):
 
@@ -278,6 +300,14 @@ class Places(object):
         # Save items as csv
         services.data.save_items(self.entity, self.fieldnames, items)
 
+    @classmethod
+    def get_wanted(cls):
+        """Return the (entity, year, exclude) items that run loads.
+        """
+        return (services.data.get_history_wanted(cls.entity) +
+                [(cls.entity, config.ODI['current_year'], False)] +
+                Entries.get_wanted())
+
 
 # TODO: refactoring
 # Move stats logic to Census?
@@ -322,6 +352,12 @@ class Summary(object):
         # Save items as csv
         services.data.save_items(self.entity, fieldnames, items)
 
+    @classmethod
+    def get_wanted(cls):
+        """Return the (entity, year, exclude) items that run loads.
+        """
+        return Entries.get_wanted()
+
     @classmethod
     def generate_value_key(cls, year):
         """Generate key like `value_2014` for year.
@@ -330,3 +366,7 @@ class Summary(object):
         if year != config.ODI['current_year']:
             key = 'value_{year}'.format(year=year)
         return key
+
+
+# The stages of run, in order
+STAGES = [Datasets, Entries, Questions, Places, Summary]
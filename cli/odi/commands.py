@@ -31,25 +31,79 @@ def deploy():
 
 @cli.command()
 @click.option('--limited', is_flag=True)
-def populate(limited):
+@click.option('--clean-slate', is_flag=True,
+              help='Remove all page sources first, and write every file.')
+@click.option('--shard', default=None, metavar='INDEX/COUNT',
+              help='Only populate one slice of the places, like 3/8.')
+def populate(limited, clean_slate, shard):
     """Run the source data population flow.
 
     By default, only populates au and timetables, to speed up development.
 
+    Only files whose content changed are written, and only pages that are
+    no longer wanted are removed, unless --clean-slate is passed.
+
+    With --shard, only the pages of the places in that slice are written,
+    plus the overview and dataset pages for the first slice. Build each
+    slice with ODI_SHARD set to the same value, then combine the outputs
+    with `odi merge`.
+
     """
 
     config = services.config.get_config(key='ODI')
 
     click.echo('Populating the content source files from data.')
     if limited:
-        actions.populate.run(limited_places=config['limited']['places'],
-                             limited_datasets=config['limited']['datasets'])
+        counts = actions.populate.run(
+            limited_places=config['limited']['places'],
+            limited_datasets=config['limited']['datasets'],
+            clean_slate=clean_slate, shard=shard)
     else:
-        actions.populate.run()
+        counts = actions.populate.run(clean_slate=clean_slate, shard=shard)
+
+    click.echo('{created} created, {updated} updated, {removed} removed, '
+               '{unchanged} unchanged.'.format(**counts))
 
 
 @cli.command()
-def prepare():
+@click.argument('sources', nargs=-1, required=True,
+                type=click.Path(exists=True, file_okay=False))
+@click.option('--output', default=None,
+              help='Merge into this directory, instead of the output path.')
+@click.option('--clean-slate', is_flag=True,
+              help='Remove everything in the output directory first.')
+def merge(sources, output, clean_slate):
+    """Merge the output of sharded builds.
+
+    Each of SOURCES is the output of a build run with ODI_SHARD set, like
+    `ODI_SHARD=3/8 pelican content -s config_default.py -o output-3`.
+
+    Files left in the output directory by earlier runs are listed, unless
+    --clean-slate is passed.
+
+    """
+
+    config = services.config.get_config(key='ODI')
+    output = output or config['output_path']
+
+    click.echo('Merging {0} builds into {1}.'.format(len(sources), output))
+    try:
+        counts, conflicts, stale = actions.merge.run(
+            sources, output, clean_slate=clean_slate)
+    except actions.merge.OverlapError as exception:
+        raise click.BadParameter(str(exception), param_hint='SOURCES')
+
+    click.echo('{copied} copied, {skipped} skipped.'.format(**counts))
+    for conflict in conflicts:
+        click.echo('Differs between builds, kept the first: ' + conflict)
+    for path in stale:
+        click.echo('Not from any of the builds: ' + path)
+
+
+@cli.command()
+@click.option('--offline', is_flag=True,
+              help='Only use responses recorded by an earlier run.')
+def prepare(offline):
     """Prepare data for the population stage.
 
     What happens:
@@ -57,8 +111,12 @@ def prepare():
     * Transform the live data into the schema that the Index requires
     * Load the transformed data into the Index database
 
+    Responses are recorded under the tmp path, and later runs only download
+    the ones that changed. With --offline, recorded responses are used
+    without any network requests.
+
     """
-    actions.prepare.run()
+    actions.prepare.run(offline=offline)
 
 
 @cli.command()
@@ -1,20 +1,88 @@
 import os
+import json
+import hashlib
 import operator
+import tempfile
+import threading
 import requests
 import unicodecsv as csv
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from . import config
 config = config.get_config()
 cache = {}
+session = []
+session_lock = threading.Lock()
+# Serve recorded responses only, without any network I/O
+offline = False
+
+
+class OfflineError(Exception):
+    """A response is needed offline that was never recorded.
+    """
+
+
+class ResponseCache(object):
+    """Responses on disk, by url and params, to revalidate or replay.
+
+    Each is a json file with the body and the ETag and Last-Modified
+    headers of the response.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, url, params):
+        """Return the record stored for a request, or None.
+        """
+        try:
+            with open(self.filepath(url, params)) as file:
+                return json.load(file)
+        except (IOError, ValueError):
+            return None
+
+    def set(self, url, params, response):
+        """Store and return the record of a response to a request.
+        """
+        record = {
+            'url': url,
+            'params': params,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body': response.text,
+        }
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'w') as file:
+            json.dump(record, file)
+        os.rename(tmp, self.filepath(url, params))
+        return record
+
+    def filepath(self, url, params):
+        key = json.dumps([url, sorted(params.items())])
+        return os.path.join(self.path, hashlib.sha1(key).hexdigest() + '.json')
+
+    def records(self):
+        """Yield every stored record.
+        """
+        if not os.path.isdir(self.path):
+            return
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.path, name)) as file:
+                    yield json.load(file)
 
 
 def load_history(entity):
     """Load entity data by years.
     """
     data = {}
-    for year in config.ODI['years']:
+    for entity, year, exclude in get_history_wanted(entity):
         # Load data for year as list
-        items = load_items(entity, year=year)
+        items = load_items(entity, year=year, exclude=exclude)
         # Index data by id, list to dict conversion
         data[year] = OrderedDict()
         for item in items:
@@ -22,31 +90,126 @@ def load_history(entity):
     return data
 
 
-def load_items(entity, year=None, exclude=True):
-    """Load json results from url.
+def get_history_wanted(entity):
+    """Return the (entity, year, exclude) items that load_history loads.
+    """
+    return [(entity, year, True) for year in config.ODI['years']]
+
+
+def get_session():
+    """Return the session shared by all requests, set up on first use.
+
+    Its connection pool holds a connection per fetch worker, and failed
+    requests are retried with backoff, see ODI['fetch']. The first use may
+    come from several fetch workers at once, so setting up is locked.
+    """
+    with session_lock:
+        if not session:
+            settings = config.ODI['fetch']
+            retry = Retry(total=settings['retries'],
+                          backoff_factor=settings['backoff'],
+                          status_forcelist=[429, 500, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=settings['workers'],
+                                  pool_maxsize=settings['workers'],
+                                  max_retries=retry)
+            shared = requests.Session()
+            shared.mount('http://', adapter)
+            shared.mount('https://', adapter)
+            session.append(shared)
+    return session[0]
+
+
+def get_request(entity, year=None, exclude=True):
+    """Return cache key, url and params to load entity items for year.
     """
     if year is None:
         year = config.ODI['current_year']
     hash = '-'.join([entity, year, str(exclude)])
+    db = config.ODI['database'][entity]
+    url = db.format(year=year)
+    pld = {}
+    if exclude:
+        for item in ['datasets', 'places']:
+            key = 'exclude_%s' % item
+            try:
+                value = ','.join(config.ODI['exclude'][year][item])
+                pld[key] = value
+            except Exception:
+                pass
+    return hash, url, pld
+
+
+def get_response_cache():
+    """Return the cache of responses under ODI['tmp_path'], if it is on.
+    """
+    if not config.ODI['fetch']['cache']:
+        return None
+    return ResponseCache(os.path.join(config.ODI['tmp_path'], 'http'))
+
+
+def fetch_items(request):
+    """Fetch json results for a request from get_request.
+
+    A recorded response is revalidated with its ETag and Last-Modified, and
+    reused if it has not been modified. When offline, it is reused as is.
+    """
+    hash, url, pld = request
+    responses = get_response_cache()
+    record = responses.get(url, pld) if responses else None
+
+    if offline:
+        if record is None:
+            raise OfflineError('No recorded response for {0} {1}'.format(
+                url, pld))
+        return hash, json.loads(record['body'])['results']
+
+    headers = {}
+    if record and record['etag']:
+        headers['If-None-Match'] = record['etag']
+    if record and record['last_modified']:
+        headers['If-Modified-Since'] = record['last_modified']
+    res = get_session().get(url, params=pld, headers=headers,
+                            timeout=config.ODI['fetch']['timeout'])
+    if record and res.status_code == 304:
+        return hash, json.loads(record['body'])['results']
+
+    res.raise_for_status()
+    if responses:
+        responses.set(url, pld, res)
+    return hash, res.json()['results']
+
+
+def load_items(entity, year=None, exclude=True):
+    """Load json results from url.
+    """
+    request = get_request(entity, year=year, exclude=exclude)
+    hash = request[0]
     if hash not in cache:
-        db = config.ODI['database'][entity]
-        url = db.format(year=year)
-        pld = {}
-        if exclude:
-            for item in ['datasets', 'places']:
-                key = 'exclude_%s' % item
-                try:
-                    value = ','.join(config.ODI['exclude'][year][item])
-                    pld[key] = value
-                except Exception:
-                    pass
-        res = requests.get(url, params=pld)
-        json = res.json()
-        items = json['results']
-        cache[hash] = items
+        cache[hash] = fetch_items(request)[1]
     return cache[hash]
 
 
+def load_many(wanted):
+    """Load items for many (entity, year, exclude) at once.
+
+    Requests not in the cache yet are fetched concurrently, by up to
+    ODI['fetch']['workers'] threads, so later load_items calls for them
+    are served from the cache.
+    """
+    pending = [get_request(entity, year=year, exclude=exclude)
+               for entity, year, exclude in wanted]
+    pending = [request for request in pending if request[0] not in cache]
+    if not pending:
+        return
+    pool = ThreadPool(min(config.ODI['fetch']['workers'], len(pending)))
+    try:
+        for hash, items in pool.imap_unordered(fetch_items, pending):
+            cache[hash] = items
+    finally:
+        pool.close()
+        pool.join()
+
+
 def add_prev_years_to_items(history, fieldnames, items):
     """Mutate items adding fields with prev year values of rank and score.
     """
@@ -65,25 +65,73 @@ JINJA_FILTERS = {
   'debug': filters.debug,
   'search': filters.search,
   'first_or_default': filters.first_or_default,
+  'if_none': filters.if_none,
+  'top': filters.top,
+  'group_by': filters.group_by,
+  'lookup': filters.lookup,
 }
 PLUGIN_PATHS = [os.path.join(PROJECT_ROOT, 'plugins')]
 PLUGINS = [
   'datastore',
   'datastore_api',
   'datastore_assets',
+  'datastore_pages',
   'i18n_subsites',
-  'pelican_alias'
+  'pelican_alias',
+  'instrumentation'
 ]
 
+# INSTRUMENTATION PLUGIN CONFIGURATION
+INSTRUMENTATION = {
+    'enabled': False, # time filters and page renders
+    'report': os.path.join(PROJECT_ROOT, 'tmp', 'instrumentation.csv')
+}
+
 # DATASTORE PLUGIN CONFIGURATION
 DATASTORE = {
     'location': os.path.join(PROJECT_ROOT, 'content', 'data'),
     'formats': ['.csv'],
+    'cache': True, # share cleaned datasets across builds in this process
+    'snapshots': os.path.join(PROJECT_ROOT, 'tmp', 'datastore'),
+    # keep rendered markdown here across builds
+    'markdown_cache': os.path.join(PROJECT_ROOT, 'tmp', 'markdown'),
+    'workers': 1, # parse sources and render markdown in this many processes
     'intrafield_delimiter': '~*',
     'true_strings': ['TRUE', 'True', 'true'],
     'false_strings': ['FALSE', 'False', 'false'],
     'none_strings': ['NULL', 'Null', 'null', 'NONE', 'None', 'none',
                      'NIL', 'Nil', 'nil', '-', 'NaN', 'N/A', 'n/a', ''],
+    'indexes': {
+        # Key must match a datastore file name.
+        # Values are tuples of headers in that file to hash index on,
+        # exposed to templates as `datastore.index.<file>.by_<headers>`.
+        'entries': [('place', 'dataset', 'year'), ('place', 'year'),
+                    ('dataset', 'year')],
+        'places': [('id',), ('slug',)],
+        'datasets': [('id',)]
+    },
+    'schema': {
+        # Key must match a datastore file name.
+        # Values map headers in that file to a type to coerce them to on
+        # load: int, float, datetime (see `datetime_format`), or key (a
+        # string interned so that equal values share one object).
+        'entries': {'year': 'key', 'rank': 'int', 'score': 'int',
+                    'timestamp': 'datetime'},
+        'places': {'rank': 'int', 'score': 'int',
+                   'rank_2014': 'int', 'score_2014': 'int',
+                   'rank_2013': 'int', 'score_2013': 'int'},
+        'datasets': {'rank': 'int', 'score': 'int',
+                     'rank_2014': 'int', 'score_2014': 'int',
+                     'rank_2013': 'int', 'score_2013': 'int'}
+    },
+    'datetime_format': '%Y-%m-%dT%H:%M:%S',
+    'markdown': {
+        # Key must match a datastore file name.
+        # Values are headers in that file to pre-render with the markdown
+        # filter on load, exposed to templates as `<header>_html`.
+        'entries': ['details', 'reviewcomments'],
+        'datasets': ['description']
+    },
     'api': { # settings for the datastore_api plugin
         'base': 'api', # directory relative to `output`
         'formats': ['json', 'csv'], # output API in these formats
@@ -98,6 +146,13 @@ DATASTORE = {
     },
     'assets': {
         'location': 'downloads'
+    },
+    'pages': { # settings for the datastore_pages plugin
+        'enabled': True, # build place and dataset pages without `odi populate`
+        'limited': False, # only build pages for ODI['limited']
+        # only build pages for one slice of the places, like `3/8`, see
+        # `odi merge`
+        'shard': os.environ.get('ODI_SHARD')
     }
 }
 
@@ -155,6 +210,13 @@ ODI = {
         'questions': 'http://global.census.okfn.org/api/questions.json',
         'places': 'http://global.census.okfn.org/api/places/score/{year}.cascade.json',
     },
+    'fetch': { # how `odi prepare` loads the database
+        'workers': 8, # concurrent requests
+        'retries': 3, # retries of failed requests, with backoff
+        'backoff': 0.5, # seconds, doubled on each retry
+        'timeout': 60, # seconds
+        'cache': True # keep responses under tmp_path, and revalidate them
+    },
     'include': {
         'datasets': [],  # example: 'timetables' or 'timetables-2015'
         'places': [],  # example: 'au' or 'au-2015'
@@ -189,6 +251,7 @@ ODI = {
         'datasets': ['statistics'],
         'places': ['gb'],
     },
+    'populate_workers': 8, # threads writing page sources in `odi populate`
     'forms': {
       'download': {
         'url': 'https://docs.google.com/forms/d/1fEJxaJdOI9SxicgS3INwrgtGLK43qLTPpFiQ-e2ISm0/viewform?embedded=true',
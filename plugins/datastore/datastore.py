@@ -1,18 +1,490 @@
 import os
+import glob
+import json
+import errno
+import hashlib
+import datetime
+import tempfile
+import collections
+import multiprocessing
+import cPickle as pickle
+from operator import itemgetter
+from collections import OrderedDict
 import tablib
+import unicodecsv as csv
 from pelican import signals
+from blinker import signal
+
+
+# Bump whenever cleaning changes shape, so old snapshots are not reused.
+SNAPSHOT_VERSION = 3
+
+
+# Cleaned datasets shared by every DataStore in the process (the `data`
+# hook, the API generator, populate and each i18n subsite), keyed by
+# source path. Values are (signature, dataset) pairs: see DataStore.signature.
+_cache = {}
+_missing = object()
+
+# Bumped whenever shared datasets are dropped, so caches derived from them
+# (like the search index of the Jinja filters) know to start over. Sent to
+# listeners of `datastore_refreshed` by the `data` hook on every build.
+_generation = [0]
+refreshed = signal('datastore_refreshed')
+
+# Values coerced to `key` by a schema, so equal keys are one object.
+_keys = {}
+
+
+def intern_key(value):
+    """Return the shared copy of the string `value`."""
+
+    return _keys.setdefault(value, value)
+
+
+def invalidate(source=None):
+    """Drop shared datasets so the next build re-reads them from disk.
+
+    Pass a `source` path to drop a single dataset. Changed files are
+    already detected by their mtime and size (see DataStore.refresh), but
+    anything that edits sources in place without touching them can call
+    this instead.
+
+    """
+
+    if source is None:
+        _cache.clear()
+    else:
+        _cache.pop(source, None)
+
+    _generation[0] += 1
+
+
+def generation():
+    """Return the current generation of the shared datasets."""
+
+    return _generation[0]
+
+
+class Record(object):
+
+    """An immutable, array-backed row of a Table.
+
+    Values are read by header, either as items (`record['score']`) or as
+    attributes (`record.score`), so records work with the Jinja filters and
+    templates written against dicts. Each Table gets its own subclass from
+    record_class(), which holds the header positions.
+
+    """
+
+    __slots__ = ('_values',)
+    _fields = ()
+    _index = {}
+
+    def __init__(self, values):
+        object.__setattr__(self, '_values', values)
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            raise KeyError(key)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[self._index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Record objects are immutable')
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return '<Record {0}>'.format(dict(self.items()))
+
+    def get(self, key, default=None):
+        if key in self._index:
+            return self._values[self._index[key]]
+        return default
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._fields, self._values)
+
+
+def record_class(headers):
+    """Return a Record subclass for rows with these `headers`."""
+
+    index = dict((header, position) for position, header in enumerate(headers))
+
+    return type('Record', (Record,), {
+        '__slots__': (),
+        '_fields': tuple(headers),
+        '_index': index,
+    })
+
+
+class Index(dict):
+
+    """A hash index over one or more columns of a Table.
+
+    Maps the value of the columns (a tuple of values, for more than one
+    column) to a tuple of the matching records, in table order. Looking up
+    a key with no records gives an empty tuple.
+
+    """
+
+    def __init__(self, rows, columns):
+        super(Index, self).__init__()
+        self.columns = tuple(columns)
+
+        if len(self.columns) == 1:
+            key = itemgetter(self.columns[0])
+        else:
+            key = itemgetter(*self.columns)
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(key(row), []).append(row)
+
+        self.update((k, tuple(v)) for k, v in groups.iteritems())
+
+    def __missing__(self, key):
+        return ()
+
+
+class Rows(tuple):
+
+    """The records of a Table, with their hash indexes.
+
+    Indexes are built on first use by get_index(), and live as long as the
+    rows do. Filters can use them to answer equality lookups without a
+    scan (see Query in utilities/filters.py).
+
+    """
+
+    def __init__(self, records=()):
+        super(Rows, self).__init__()
+        self.indexes = {}
+
+    def get_index(self, columns):
+        """Return the Index over `columns`, building it on first use."""
+
+        columns = tuple(columns)
+
+        if columns not in self.indexes:
+            self.indexes[columns] = Index(self, columns)
+
+        return self.indexes[columns]
+
+
+def index_name(columns):
+    """Return the name an index over `columns` is exposed as."""
+
+    return 'by_' + '_'.join(columns)
+
+
+def coerce_row(row, coercions):
+    """Return `row` as a tuple, with `coercions` applied to its strings.
+
+    `coercions` is a list of (position, callable) pairs. Values that can't
+    be coerced are kept as they are.
+
+    """
+
+    row = list(row)
+
+    for position, coerce in coercions:
+        value = row[position]
+        if not isinstance(value, basestring):
+            continue
+        try:
+            row[position] = coerce(value)
+        except (TypeError, ValueError):
+            pass
+
+    return tuple(row)
+
+
+class Table(tablib.Dataset):
+
+    """A cleaned tablib.Dataset with a materialized view of its rows.
+
+    `rows` is a tuple of Records built once, when the table is loaded.
+    Templates and plugins should iterate it rather than `dict`, which
+    tablib rebuilds as a fresh list of fresh dicts on every access.
+
+    Pass a `schema` of header to callable to coerce the values of `rows`.
+    The tablib data itself keeps the cleaned strings, so exports such as
+    the API are unchanged.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        schema = kwargs.pop('schema', None) or {}
+        super(Table, self).__init__(*args, **kwargs)
+        headers = self.headers or ()
+        record = record_class(headers)
+        rows = self[:]
+
+        coercions = [(position, schema[header]) for
+                     position, header in enumerate(headers) if
+                     header in schema]
+        if coercions:
+            rows = (coerce_row(row, coercions) for row in rows)
+
+        self.rows = Rows(record(row) for row in rows)
+
+    def add_columns(self, columns):
+        """Add derived `columns` to `rows`, but not to the tablib data.
+
+        `columns` is a list of (header, values) pairs, with a value for each
+        row. The rows are built again, with indexes of their own.
+
+        """
+
+        if not columns:
+            return
+
+        fields = self.rows[0]._fields if self.rows else tuple(self.headers or ())
+        record = record_class(fields + tuple(header for header, _ in columns))
+        extras = zip(*[values for _, values in columns])
+        self.rows = Rows(record(row._values + extra) for
+                         row, extra in zip(self.rows, extras))
+
+    def index(self, columns):
+        """Return the Index over `columns` of `rows`, see Rows.get_index."""
+
+        return self.rows.get_index(columns)
+
+
+class DataContext(collections.Mapping):
+
+    """The datasets of a build by name, plus their configured indexes.
+
+    Datasets are parsed and cleaned the first time they are looked up, so
+    a build only pays for the files its templates and plugins actually
+    read. `used` holds the names looked up so far. Iterating the context
+    loads every dataset, through DataStore.load_all().
+
+    `index` holds the indexes declared in DATASTORE['indexes'] per dataset,
+    by index_name(), so templates can do O(1) lookups like:
+
+        datastore.index.entries.by_place_year[(page.place, page.year)]
+
+    """
+
+    def __init__(self, store, sources):
+        self._store = store
+        self._sources = sources
+        self._datasets = {}
+        self.used = set()
+        self.index = IndexContext(self)
+
+    def __getitem__(self, key):
+        if key not in self._sources:
+            raise KeyError(key)
+
+        self.used.add(key)
+
+        if key not in self._datasets:
+            dataset = self._store.load(self._sources[key])
+            self._datasets[key] = self._store.render_markdown(key, dataset)
+
+        dataset = self._datasets[key]
+        if not dataset:
+            raise KeyError(key)
+        return dataset
+
+    def __iter__(self):
+        self.load_all()
+        return (key for key in self._sources if self._datasets[key])
+
+    def __len__(self):
+        return sum(1 for _key in self)
+
+    def load_all(self):
+        """Load every dataset not loaded yet, in one go."""
+
+        pending = [key for key in self._sources if key not in self._datasets]
+        loaded = self._store.load_all([self._sources[key] for key in pending])
+        self._datasets.update((key, self._store.render_markdown(key, dataset))
+                              for key, dataset in zip(pending, loaded))
+        self.used.update(pending)
+
+
+class IndexContext(collections.Mapping):
+
+    """The indexes of a DataContext's datasets, built on first lookup."""
+
+    def __init__(self, context):
+        self._context = context
+        self._indexes = {}
+
+    def __getitem__(self, key):
+        if key not in self._indexes:
+            declared = self._context._store.get_indexes(key)
+            if not declared or key not in self._context:
+                raise KeyError(key)
+            table = self._context[key]
+            self._indexes[key] = dict((index_name(columns),
+                                       table.index(columns)) for
+                                      columns in declared)
+        return self._indexes[key]
+
+    def __iter__(self):
+        return (key for key in self._context._store.get_indexes() if
+                key in self._context)
+
+    def __len__(self):
+        return sum(1 for _key in self)
+
+
+def pack_table(table):
+    """Return `table` as plain (headers, rows) data, for pickling."""
+
+    if not table:
+        return None
+
+    return (table.headers, table[:])
+
+
+def unpack_table(payload, schema=None):
+    """Return the Table for a payload from pack_table()."""
+
+    if payload is None:
+        return None
+
+    headers, rows = payload
+    return Table(*rows, headers=headers, schema=schema)
+
+
+def pool_map(func, items, workers):
+    """Return map(func, items), in a pool of up to `workers` processes."""
+
+    if workers > 1 and len(items) > 1:
+        pool = multiprocessing.Pool(min(workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    return map(func, items)
+
+
+def _parse_source(args):
+    """Parse one source in a worker process, see DataStore.load_all."""
+
+    settings, source = args
+    datastore = DataStore({'DATASTORE': dict(settings, cache=False)})
+
+    return pack_table(datastore.parse(source))
+
+
+class Normalizer(object):
+
+    """Cleans the values of a dataset with rules compiled from DATASTORE.
+
+    The true, false and none strings are compiled into a single lookup
+    table. Rows are cleaned a column at a time: the rules only run over the
+    distinct values of a column, and a column with no boolean, null, list
+    or padded values is skipped entirely.
+
+    """
+
+    def __init__(self, settings):
+        self.delimiter = settings['intrafield_delimiter']
+        self.table = {}
+
+        # later rules win, as they did when each list was checked in turn
+        for rule, value in (('true_strings', True),
+                            ('false_strings', False),
+                            ('none_strings', None)):
+            for string in settings[rule]:
+                self.table[string] = value
+
+    def clean(self, rows, width):
+        """Clean the first `width` columns of each row in `rows`, in place."""
+
+        for index in range(width):
+            plan = self.compile(set(map(itemgetter(index), rows)))
+
+            if not plan:
+                continue
+
+            for row in rows:
+                value = plan.get(row[index], row)
+                if value is row:
+                    continue
+                if isinstance(value, tuple):
+                    # every row gets its own list
+                    value = list(value)
+                row[index] = value
+
+        return rows
+
+    def compile(self, values):
+        """Return a mapping of each raw value that changes to its clean value.
+
+        Delimited lists are returned as tuples, to be copied per row.
+
+        """
+
+        plan = {}
+
+        for raw in values:
+            value = raw.strip()
+
+            if value in self.table:
+                plan[raw] = self.table[value]
+            elif self.delimiter in value:
+                plan[raw] = tuple(value.split(self.delimiter))
+            elif value != raw:
+                plan[raw] = value
+
+        return plan
 
 
 class DataStore(object):
 
     """Interface for static file datastore.
 
-    self.build() returns a dict where `key` is the name of the dataset,
-    and `value` is a tablib.Dataset object.
+    self.build() returns a DataContext: a mapping where `key` is the name of
+    the dataset, and `value` is a Table: a tablib.Dataset that also exposes
+    its rows as immutable records. Datasets are only parsed once looked up,
+    and hash indexes declared in DATASTORE['indexes'] along with them.
 
-    At present, should support any file format that tablib can import:
-    * csv
-    * json
+    Cleaned datasets are shared process-wide, so building more than once
+    only parses sources that changed since the previous build. Set
+    DATASTORE['cache'] to False to always parse from scratch.
+
+    If DATASTORE['snapshots'] names a directory, cleaned datasets are also
+    pickled there, keyed by the content hash of the source and the cleaning
+    settings, so unchanged sources skip parsing on the next run too.
+
+    Sources are read in a stable order, and with DATASTORE['workers'] above
+    1, sources that are not already cached are parsed in a process pool.
+
+    CSV and JSON sources are streamed row by row, then cleaned a column at a
+    time by a Normalizer. Any other format listed in DATASTORE['formats'] goes
+    through tablib, so should support any file format that tablib can import:
     * yaml
     * see tablib for full support.
 
@@ -21,6 +493,20 @@ class DataStore(object):
     def __init__(self, config, **kwargs):
         self.config = config
         self.intrafield_delimiter = self.config['DATASTORE']['intrafield_delimiter']
+        self.normalizer = Normalizer(self.config['DATASTORE'])
+        datetime_format = self.config['DATASTORE'].get('datetime_format',
+                                                       '%Y-%m-%dT%H:%M:%S')
+        self.coercions = {
+            'int': int,
+            'float': float,
+            'datetime': lambda value: datetime.datetime.strptime(
+                value, datetime_format),
+            'key': intern_key,
+        }
+        self.readers = {
+            '.csv': self._read_csv,
+            '.json': self._read_json,
+        }
         # TODO: handle the required settings
         if not 'DATASTORE' in self.config:
             raise KeyError
@@ -33,27 +519,268 @@ class DataStore(object):
         """
 
         datasets = []
+        sources = self.get_dataset_sources()
+
+        for key, dataset_clean in zip(sources, self.load_all(sources.values())):
+            if dataset_clean:
+                datasets.append((key, dataset_clean))
+
+        return datasets
+
+    def get_dataset_sources(self):
+        """Return the source file of each dataset, by dataset name.
+
+        Only sources with an extension in DATASTORE['formats'] are datasets.
+        If two sources share a name, the last one in walk order wins.
+
+        """
+
+        sources = OrderedDict()
 
         for source in self.get_sources():
             _path, ext = os.path.splitext(source)
 
             if ext in self.config['DATASTORE']['formats']:
                 _head, key = os.path.split(_path)
-                dataset_raw = self._extract_data(source)
-                if dataset_raw:
-                    dataset_clean = self._clean_data(dataset_raw)
-                    datasets.append((key, dataset_clean))
+                sources.pop(key, None)
+                sources[key] = source
 
-        return datasets
+        return sources
+
+    def load(self, source):
+        """Return the cleaned dataset for `source`, parsing it if needed."""
+
+        dataset = self.get_cached(source)
+
+        if dataset is _missing:
+            dataset = self.parse(source)
+            self.set_cached(source, dataset)
+
+        return dataset
+
+    def load_all(self, sources):
+        """Return the cleaned dataset for each of `sources`, in order.
+
+        With DATASTORE['workers'] above 1, the sources that are not cached
+        yet are parsed and cleaned in a pool of that many processes.
+
+        """
+
+        workers = self.config['DATASTORE'].get('workers', 1)
+        stale = [source for source in sources if
+                 self.get_cached(source) is _missing]
+        parsed = {}
+
+        if workers > 1 and len(stale) > 1:
+            payloads = pool_map(_parse_source,
+                                [(self.config['DATASTORE'], source) for
+                                 source in stale], workers)
+
+            for source, payload in zip(stale, payloads):
+                parsed[source] = unpack_table(payload, self.get_schema(source))
+                self.set_cached(source, parsed[source])
+
+        return [parsed[source] if source in parsed else self.load(source) for
+                source in sources]
+
+    def render_markdown(self, key, dataset):
+        """Pre-render the markdown columns DATASTORE['markdown'] declares.
+
+        Each declared column gets a `<column>_html` column in the rows of
+        `dataset`, rendered with the `markdown` Jinja filter of the build, so
+        templates read the HTML instead of converting text on every page.
+        Distinct texts are converted once, across DATASTORE['workers']
+        processes. Values that are not text render as None.
+
+        Without a markdown filter in JINJA_FILTERS (as when populating),
+        the dataset is returned as it is.
+
+        """
+
+        convert = self.config.get('JINJA_FILTERS', {}).get('markdown')
+        declared = self.config['DATASTORE'].get('markdown', {}).get(key, ())
+
+        if not dataset or not convert:
+            return dataset
+
+        fields = dataset.rows[0]._fields
+        columns = [column for column in declared if column in fields and
+                   column + '_html' not in fields]
+        if not columns:
+            return dataset
+
+        texts = sorted(set(row[column] for row in dataset.rows for
+                           column in columns if
+                           isinstance(row[column], basestring)))
+        workers = self.config['DATASTORE'].get('workers', 1)
+        if workers > 1:
+            # wrapped filters (eg. instrumented ones) can't be pickled
+            convert = getattr(convert, '__wrapped__', convert)
+        rendered = dict(zip(texts, pool_map(convert, texts, workers)))
+
+        dataset.add_columns([(column + '_html',
+                              [rendered.get(row[column]) if
+                               isinstance(row[column], basestring) else None
+                               for row in dataset.rows]) for
+                             column in columns])
+        return dataset
+
+    def get_cached(self, source):
+        """Return the shared dataset for `source` if it is current.
+
+        Returns the _missing marker otherwise, as None is a valid dataset.
+
+        """
+
+        if not self.config['DATASTORE'].get('cache', True):
+            return _missing
+
+        if source in _cache:
+            cached_signature, dataset = _cache[source]
+            if cached_signature == self.signature(source):
+                return dataset
+
+        return _missing
+
+    def set_cached(self, source, dataset):
+        """Share the dataset for `source` with the rest of the process."""
+
+        if self.config['DATASTORE'].get('cache', True):
+            _cache[source] = (self.signature(source), dataset)
+
+    def parse(self, source):
+        """Return the cleaned dataset for `source`, from its snapshot if any."""
+
+        snapshot = self.get_snapshot(source)
+
+        # another build may remove or replace the snapshot at any time, and
+        # one that is corrupt, or written by another version, may not load:
+        # parse it again then
+        if snapshot and os.path.exists(snapshot):
+            try:
+                return self._read_snapshot(snapshot, self.get_schema(source))
+            except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                    ValueError, AttributeError, ImportError, IndexError,
+                    KeyError):
+                pass
+
+        dataset = self._extract_data(source)
+
+        if snapshot:
+            self._write_snapshot(snapshot, dataset)
+
+        return dataset
+
+    def refresh(self):
+        """Drop shared datasets whose source changed or went away.
+
+        This is the incremental step of autoreload mode: only the changed
+        sources are parsed again, when next looked up. Bumps the generation
+        if anything was dropped, or on every call with DATASTORE['cache']
+        off, and returns the dropped sources.
+
+        """
+
+        if not self.config['DATASTORE'].get('cache', True):
+            _generation[0] += 1
+            return []
+
+        changed = sorted(source for source, (cached_signature, _dataset) in
+                         _cache.items() if not os.path.exists(source) or
+                         cached_signature != self.signature(source))
+
+        for source in changed:
+            _cache.pop(source)
+
+        if changed:
+            _generation[0] += 1
+
+        return changed
+
+    def signature(self, source):
+        """Return what a cached dataset for `source` is only valid for.
+
+        That is the file's mtime and size, plus the cleaning settings, so a
+        changed file or a changed config both force a fresh parse.
+
+        """
+
+        stat = os.stat(source)
+
+        return (stat.st_mtime, stat.st_size) + self.get_rules()
+
+    def get_rules(self):
+        """Return the settings that change how a source is cleaned."""
+
+        settings = self.config['DATASTORE']
+
+        return (settings['intrafield_delimiter'],
+                tuple(settings['true_strings']),
+                tuple(settings['false_strings']),
+                tuple(settings['none_strings']),
+                tuple((key, tuple(sorted(schema.items()))) for key, schema in
+                      sorted(settings.get('schema', {}).items())),
+                settings.get('datetime_format'))
+
+    def get_schema(self, source):
+        """Return the coercions DATASTORE['schema'] declares for `source`.
+
+        Returns a dict of header to callable, see Table.
+
+        """
+
+        _path, _ext = os.path.splitext(source)
+        _head, key = os.path.split(_path)
+        declared = self.config['DATASTORE'].get('schema', {}).get(key, {})
+
+        return dict((header, self.coercions[kind]) for
+                    header, kind in declared.items())
+
+    def get_snapshot(self, source):
+        """Return the snapshot path for the current contents of `source`.
+
+        Returns None when snapshots are not configured.
+
+        """
+
+        location = self.config['DATASTORE'].get('snapshots')
+
+        if not location:
+            return None
+
+        digest = hashlib.sha1(repr((SNAPSHOT_VERSION, self.get_rules())))
+
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+
+        _path, _ext = os.path.splitext(source)
+        _head, key = os.path.split(_path)
+        name = '{0}-{1}.pickle'.format(key, digest.hexdigest())
+
+        return os.path.join(location, name)
 
     def build(self):
-        """Return processed datasets as a dict to add to meta context."""
+        """Return the datasets as a DataContext to add to meta context.
+
+        Nothing is parsed until a dataset is looked up in the context.
+
+        """
+
+        return DataContext(self, self.get_dataset_sources())
+
+    def get_indexes(self, key=None):
+        """Return the indexes DATASTORE['indexes'] declares for `key`.
+
+        Without a key, returns the declared indexes of every dataset.
+
+        """
 
-        rv = {}
+        declared = self.config['DATASTORE'].get('indexes', {})
 
-        for dataset in self.process():
-            rv[dataset[0]] = dataset[1]
-        return rv
+        if key is None:
+            return declared
+        return declared.get(key, ())
 
     def get_location(self):
         return self.config['DATASTORE']['location']
@@ -69,77 +796,154 @@ class DataStore(object):
 
         sources = []
 
-        for (dirpath, _, filenames) in os.walk(self.get_location()):
+        for (dirpath, dirnames, filenames) in os.walk(self.get_location()):
+            # walk in a stable order, so builds are deterministic
+            dirnames.sort()
             sources.extend(os.path.join(dirpath, filename) for
-                           filename in filenames)
+                           filename in sorted(filenames))
 
         return sources
 
     def _extract_data(self, data_source):
-        """Create a Dataset object from the data source."""
+        """Create a clean Dataset object from the data source.
 
-        with open(data_source) as f:
-            stream = f.read()
-            extracted = tablib.import_set(stream)
+        The reader is picked by file extension. Formats without a streaming
+        reader are handed to tablib whole, and cleaned afterwards.
 
-        # TODO: Notify which sources could not be serialized by tablib
-        return extracted
+        """
 
-    def _clean_data(self, raw_dataset):
-        """Takes the raw Dataset and cleans it up."""
+        _path, ext = os.path.splitext(data_source)
+        reader = self.readers.get(ext)
 
-        dataset_clean_headers = self._normalize_headers(raw_dataset)
-        dataset_clean = self._normalize_rows(dataset_clean_headers)
+        if reader is None:
+            with open(data_source) as f:
+                stream = f.read()
+                extracted = tablib.import_set(stream)
 
-        return dataset_clean
+            # TODO: Notify which sources could not be serialized by tablib
+            if not extracted:
+                return None
+            return self._clean_data(extracted, self.get_schema(data_source))
 
-    def _normalize_headers(self, dataset):
-        """Clean up the headers of each Dataset."""
+        with open(data_source, 'rb') as f:
+            headers, rows = reader(f)
+            if not headers:
+                return None
+            return self._build_dataset(headers, rows,
+                                       self.get_schema(data_source))
 
-        transform_chars = {
-            # Note: We allow the "_" symbol in headers.
-            ord('-'): None,
-            ord('"'): None,
-            ord(' '): None,
-            ord("'"): None,
-        }
+    def _read_csv(self, stream):
+        """Return the headers and a row iterator for a CSV stream."""
 
-        for index, header in enumerate(dataset.headers):
-            tmp = unicode(header).translate(transform_chars).lower()
-            dataset.headers[index] = tmp
+        reader = csv.reader(stream, encoding='utf-8')
+        headers = next(reader, None)
 
-        return dataset
+        return headers, reader
 
-    def _normalize_rows(self, dataset):
-        """Clean up each object in the Dataset."""
+    def _read_json(self, stream):
+        """Return the headers and a row iterator for a JSON list of objects."""
 
-        workspace = dataset.dict
+        items = json.load(stream, object_pairs_hook=OrderedDict)
 
-        for item in workspace:
-            for k, v in item.iteritems():
+        if not items:
+            return None, iter(())
 
-                # remove whitespace
-                item[k] = v.strip()
+        headers = list(items[0].keys())
+        rows = ([item.get(header, u'') for header in headers]
+                for item in items)
 
-                if v in self.config['DATASTORE']['true_strings']:
-                    item[k] = True
+        return headers, rows
 
-                if v in self.config['DATASTORE']['false_strings']:
-                    item[k] = False
+    def _build_dataset(self, headers, rows, schema=None):
+        """Create a clean Dataset object from headers and raw rows."""
 
-                if v in self.config['DATASTORE']['none_strings']:
-                    item[k] = None
+        # A repeated header keeps its first position and its last value,
+        # as it did when rows went through a dict.
+        positions = OrderedDict()
+        for index, header in enumerate(self._normalize_headers(headers)):
+            positions[header] = index
 
-                if self.intrafield_delimiter in v:
-                    item[k] = v.split(self.intrafield_delimiter)
+        columns = list(positions.values())
+        width = len(headers)
+        raw = []
 
-        dataset.dict = workspace
+        for row in rows:
+            # skip blank lines
+            if not row:
+                continue
 
-        return dataset
+            if len(row) < width:
+                row = row + [u''] * (width - len(row))
+
+            raw.append([row[index] for index in columns])
+
+        cleaned = self.normalizer.clean(raw, len(columns))
+
+        return Table(*cleaned, headers=list(positions), schema=schema)
+
+    def _read_snapshot(self, snapshot, schema=None):
+        """Create a Dataset object from a snapshot."""
+
+        with open(snapshot, 'rb') as f:
+            return unpack_table(pickle.load(f), schema)
+
+    def _write_snapshot(self, snapshot, dataset):
+        """Store `dataset` as `snapshot`, replacing older snapshots of it."""
+
+        location, name = os.path.split(snapshot)
+        key = name.rsplit('-', 1)[0]
+
+        try:
+            os.makedirs(location)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # other builds sharing the location may remove the same files
+        pattern = '{0}-{1}.pickle'.format(key, '[0-9a-f]' * 40)
+        for stale in glob.glob(os.path.join(location, pattern)):
+            if stale == snapshot:
+                continue
+            try:
+                os.remove(stale)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+        # write then rename, so a half-written snapshot is never read
+        fd, tmp = tempfile.mkstemp(dir=location)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(pack_table(dataset), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, snapshot)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def _clean_data(self, raw_dataset, schema=None):
+        """Takes the raw Dataset and cleans it up."""
+
+        return self._build_dataset(raw_dataset.headers, raw_dataset[:], schema)
+
+    def _normalize_headers(self, headers):
+        """Clean up the headers of a Dataset."""
+
+        transform_chars = {
+            # Note: We allow the "_" symbol in headers.
+            ord('-'): None,
+            ord('"'): None,
+            ord(' '): None,
+            ord("'"): None,
+        }
+
+        return [unicode(header).translate(transform_chars).lower() for
+                header in headers]
 
 
 def data(page_generator_init):
     datastore = DataStore(page_generator_init.settings)
+    datastore.refresh()
+    refreshed.send(generation())
     page_generator_init.context['datastore'] = datastore.build()
 
 
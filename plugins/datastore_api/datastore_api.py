@@ -58,13 +58,9 @@ class APIGenerator(generators.Generator):
         """Write an API endpoint for this dataset slice."""
 
         if not name in self.api_exclude:
-            # Get the unique values in the dataset for `slice_attr`
-            slice_values = frozenset(dataset[slice_attr])
-
-            # Write a slice for each unique value
-            for _slice in slice_values:
-                sliced_dataset = self.get_sliced_dataset(dataset, slice_attr,
-                                                          _slice)
+            # Write a slice for each unique value in the dataset for `slice_attr`
+            for _slice, sliced_dataset in self.get_sliced_datasets(
+                    dataset, slice_attr).items():
                 slice_slug = _slice.lower().replace(' ', '-').replace(',', '-')
                 slice_dir = os.path.join(self.api_path, name)
 
@@ -77,13 +73,21 @@ class APIGenerator(generators.Generator):
                     with open(dest_path, 'w+') as f:
                         f.write(getattr(sliced_dataset, api_format))
 
-    def get_sliced_dataset(self, dataset, slice_attr, slice_value):
-        """Return a new tablib.Dataset based on passed data."""
+    def get_sliced_datasets(self, dataset, slice_attr):
+        """Return a new tablib.Dataset per unique value of `slice_attr`.
+
+        Slices are collected in a single pass over the dataset's cleaned
+        string data, not its `rows`, which may hold coerced values.
+
+        """
+
+        position = dataset.headers.index(slice_attr)
+        slices = {}
+        for row in dataset[:]:
+            slices.setdefault(row[position], []).append(row)
 
-        sliced_dataset = tablib.Dataset()
-        sliced_dataset.dict = [obj for obj in dataset.dict if
-                               obj[slice_attr] == slice_value]
-        return sliced_dataset
+        return dict((value, tablib.Dataset(*rows, headers=dataset.headers))
+                    for value, rows in slices.items())
 
 
 def get_generators(pelican_object):
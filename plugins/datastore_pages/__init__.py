@@ -0,0 +1,10 @@
+"""A page generator for Pelican Datastore.
+
+Builds the place and dataset pages in memory, straight from the datastore,
+instead of reading the sources written by `odi populate`. When those
+sources are read, their front matter is parsed without markdown.
+
+"""
+
+
+from .datastore_pages import *
@@ -0,0 +1,499 @@
+import os
+import re
+import hashlib
+import logging
+from operator import attrgetter
+from pelican import signals
+from pelican.contents import Page
+from pelican.readers import (BaseReader, MarkdownReader, default_metadata,
+                             parse_path_metadata)
+from pelican.utils import pelican_open, posixize_path
+
+
+logger = logging.getLogger(__name__)
+
+# Where the sources of these pages live, relative to the content path, when
+# they are written out by `odi populate`.
+PAGES_PATH = 'pages'
+SECTIONS = ('place', 'dataset')
+FILENAME = 'index.md'
+
+EMPTY_DISPLAY_TYPE = u'empty'
+NA_DISPLAY_TYPE = u'na'
+
+# A line of front matter, as matched by the markdown `meta` extension.
+META_RE = re.compile(r'^[ ]{0,3}(?P<key>[A-Za-z0-9_-]+):\s*(?P<value>.*)')
+
+
+def page_sources(places, datasets, entries, years, current_year,
+                 shared=True):
+    """Yield (path, source) for every place and dataset page.
+
+    Paths are relative to the pages directory. Sources are the front matter
+    of each page, as written by `odi populate` and read back by `pages`.
+    The overviews and dataset pages are left out unless `shared`.
+
+    """
+
+    # Display types only depend on whether any entry exists for a
+    # (place, year) or (place, dataset, year), so they are looked up in
+    # these sets rather than found by scanning the entries per page.
+    place_years = set()
+    place_dataset_years = set()
+    for entry in entries:
+        place_years.add((entry['place'], entry['year']))
+        place_dataset_years.add((entry['place'], entry['dataset'],
+                                 entry['year']))
+
+    for page in _place_sources(places, datasets, years, current_year,
+                               place_years, place_dataset_years, shared):
+        yield page
+
+    if shared:
+        for page in _dataset_sources(datasets, years, current_year):
+            yield page
+
+
+def _source(dirpath, template, **context):
+    return (os.path.join(dirpath, FILENAME), template.format(**context))
+
+
+def _place_sources(places, datasets, years, current_year, place_years,
+                   place_dataset_years, shared):
+    """Yield the sources for places, see page_sources."""
+
+    places_dir = 'place'
+
+    if shared:
+        # write the places overview
+        yield _source(places_dir, place_overview_template,
+                      year=current_year, display_type=u'places')
+
+        # write the historical overviews
+        for year in years:
+            if year != current_year:
+                yield _source(os.path.join(places_dir, year),
+                              place_overview_historical_template,
+                              year=year, display_type=u'places')
+
+    # write files per place
+    for place in places:
+
+        # set the default display_type
+        display_type = u'place'
+
+        # the display type depends on the presence
+        # of entries in the current year
+        if (place['id'], current_year) not in place_years:
+            display_type = EMPTY_DISPLAY_TYPE
+
+        # the path of this place's directory
+        dirpath = os.path.join(places_dir, place['id'])
+        place_encname = place['name'].replace(',', '').replace(' ', '%20')
+
+        # write the place index file for the current year
+        yield _source(dirpath, place_template,
+                      place_name=place['name'], place_encname=place_encname,
+                      place_id=place['id'], place_slug=place['slug'],
+                      year=current_year, display_type=display_type)
+
+        # write the place index file for other years
+        for year in years:
+            if year != current_year:
+
+                # the display type depends on the presence of entries
+                if (place['id'], year) not in place_years:
+                    display_type = NA_DISPLAY_TYPE
+
+                yield _source(os.path.join(places_dir, place['id'], year),
+                              place_historical_template,
+                              place_name=place['name'], place_id=place['id'],
+                              place_slug=place['slug'], year=year,
+                              display_type=display_type)
+
+        # write place/dataset files
+        for dataset in datasets:
+
+            # set the default display_type
+            display_type = u'place_dataset'
+
+            # the display type depends on the presence of entries
+            if ((place['id'], dataset['id'], current_year) not in
+                    place_dataset_years):
+                display_type = EMPTY_DISPLAY_TYPE
+
+            # the path of this place/dataset directory
+            dirpath = os.path.join(places_dir, place['id'], dataset['id'])
+
+            # write the place/dataset index file for the current year
+            yield _source(dirpath, place_dataset_template,
+                          place_name=place['name'],
+                          place_encname=place_encname,
+                          place_id=place['id'], place_slug=place['slug'],
+                          dataset_name=dataset['title'],
+                          dataset_id=dataset['id'], year=current_year,
+                          display_type=display_type)
+
+            # write the place/dataset index file for other years
+            for year in years:
+                if year != current_year:
+
+                    # the display type depends on the presence of entries
+                    if ((place['id'], dataset['id'], year) not in
+                            place_dataset_years):
+                        display_type = NA_DISPLAY_TYPE
+
+                    # the path of this place/dataset/year directory
+                    dirpath = os.path.join(dirpath, year)
+
+                    yield _source(dirpath, place_dataset_historical_template,
+                                  place_name=place['name'],
+                                  place_id=place['id'],
+                                  place_slug=place['slug'],
+                                  dataset_name=dataset['title'],
+                                  dataset_id=dataset['id'], year=year,
+                                  display_type=display_type)
+
+
+def _dataset_sources(datasets, years, current_year):
+    """Yield the sources for datasets, see page_sources."""
+
+    datasets_dir = 'dataset'
+
+    # write the datasets overview
+    yield _source(datasets_dir, dataset_overview_template,
+                  year=current_year, display_type=u'datasets')
+
+    # write the historical overviews
+    for year in years:
+        if year != current_year:
+            yield _source(os.path.join(datasets_dir, year),
+                          dataset_overview_historical_template,
+                          year=year, display_type=u'datasets')
+
+    # write files per dataset
+    for dataset in datasets:
+        dirpath = os.path.join(datasets_dir, dataset['id'])
+
+        # write the dataset index file for the current year
+        yield _source(dirpath, dataset_template,
+                      dataset_name=dataset['title'],
+                      dataset_slug=dataset['id'], year=current_year,
+                      display_type=u'dataset')
+
+        # write the dataset index file for other years
+        for year in years:
+            if year != current_year:
+                yield _source(os.path.join(dirpath, year),
+                              dataset_historical_template,
+                              dataset_name=dataset['title'],
+                              dataset_slug=dataset['id'], year=year,
+                              display_type=u'dataset')
+
+
+def select(rows, ids):
+    """Return the rows whose id is in `ids`, or all of them if it is empty."""
+
+    if not ids:
+        return list(rows)
+    return [row for row in rows if row['id'] in ids]
+
+
+def parse_shard(spec):
+    """Return (index, count) for a shard spec like `3/8`, or None if empty.
+
+    Shards are numbered from 1. Raises ValueError for anything else.
+
+    """
+
+    if not spec:
+        return None
+
+    try:
+        index, count = [int(part) for part in spec.split('/')]
+    except ValueError:
+        raise ValueError('Invalid shard {0!r}, expected INDEX/COUNT, '
+                         'like 3/8'.format(spec))
+    if not 1 <= index <= count:
+        raise ValueError('Invalid shard {0!r}, INDEX must be between 1 '
+                         'and COUNT'.format(spec))
+    return index, count
+
+
+def in_shard(place_id, shard):
+    """Whether the pages of a place are built by `shard`, see parse_shard.
+
+    Places are spread by a hash of their id, so every build agrees on the
+    split, and adding a place does not move any other to another shard.
+
+    """
+
+    index, count = shard
+    digest = hashlib.md5(place_id.encode('utf-8')).hexdigest()
+    return int(digest, 16) % count == index - 1
+
+
+def is_shared(shard):
+    """Whether `shard` builds the pages that are not about one place."""
+
+    return shard is None or shard[0] == 1
+
+
+def parse_header(source):
+    """Return the metadata of a source that is only front matter, else None.
+
+    Keys are lowercased and values stripped, as the markdown `meta`
+    extension does. Sources with a body, repeated keys, continuation lines
+    or tabs return None, so they are left to the markdown reader.
+
+    """
+
+    if '\t' in source:
+        return None
+
+    metadata = {}
+    for line in source.rstrip().splitlines():
+        match = META_RE.match(line)
+        if not match:
+            return None
+        name = match.group('key').lower()
+        if name in metadata:
+            return None
+        metadata[name] = match.group('value').strip()
+    return metadata
+
+
+class FrontMatterReader(MarkdownReader):
+
+    """A markdown reader that skips markdown for front matter only sources.
+
+    Those are the pages written by `odi populate`: reading them needs no
+    markdown instance, just their metadata. Other sources are read as usual.
+
+    """
+
+    def read(self, source_path):
+        with pelican_open(source_path) as text:
+            metadata = parse_header(text)
+
+        if (metadata is None or
+                set(metadata) & set(self.settings['FORMATTED_FIELDS'])):
+            return super(FrontMatterReader, self).read(source_path)
+
+        self._source_path = source_path
+        return u'', self._parse_metadata(
+            dict((name, [value]) for name, value in metadata.items()))
+
+
+def add_reader(readers):
+    """Read markdown sources with FrontMatterReader."""
+
+    for fmt, reader_class in readers.reader_classes.items():
+        if reader_class is MarkdownReader:
+            readers.reader_classes[fmt] = FrontMatterReader
+
+
+def enabled(settings):
+    return settings.get('DATASTORE', {}).get('pages', {}).get('enabled', False)
+
+
+def exclude_sources(generator):
+    """Keep the pages generator from reading any populated sources."""
+
+    settings = generator.settings
+    if not enabled(settings):
+        return
+
+    excludes = list(settings['PAGE_EXCLUDES'])
+    for section in SECTIONS:
+        path = os.path.join(PAGES_PATH, section)
+        if path not in excludes:
+            excludes.append(path)
+    settings['PAGE_EXCLUDES'] = excludes
+
+
+def build_page(generator, reader, path, source):
+    """Return the Page the markdown reader would make of `source`."""
+
+    settings = generator.settings
+    full_path = os.path.join(generator.path, PAGES_PATH, path)
+    source_path = posixize_path(os.path.relpath(full_path, generator.path))
+
+    # there is no file to take a date or EXTRA_PATH_METADATA from
+    metadata = default_metadata(settings=settings,
+                                process=reader.process_metadata)
+    metadata.update(parse_path_metadata(source_path=source_path,
+                                        settings=settings,
+                                        process=reader.process_metadata))
+    metadata['reader'] = 'datastore'
+    for name, value in parse_header(source).items():
+        metadata[name] = reader.process_metadata(name, value)
+
+    signals.page_generator_context.send(generator, metadata=metadata)
+    return Page(content=u'', metadata=metadata, settings=settings,
+                source_path=full_path, context=generator.context)
+
+
+def pages(generator):
+    """Add the place and dataset pages to the pages generator."""
+
+    settings = generator.settings
+    if not enabled(settings):
+        return
+
+    datastore = generator.context['datastore']
+    places = datastore['places'].rows
+    datasets = datastore['datasets'].rows
+    if settings['DATASTORE']['pages'].get('limited'):
+        places = select(places, settings['ODI']['limited']['places'])
+        datasets = select(datasets, settings['ODI']['limited']['datasets'])
+
+    shard = parse_shard(settings['DATASTORE']['pages'].get('shard'))
+    if shard:
+        places = [place for place in places if in_shard(place['id'], shard)]
+
+    reader = BaseReader(settings)
+    built = []
+    for path, source in page_sources(places, datasets,
+                                     datastore['entries'].rows,
+                                     settings['ODI']['years'],
+                                     settings['ODI']['current_year'],
+                                     shared=is_shared(shard)):
+        page = build_page(generator, reader, path, source)
+        page.translations = []
+        generator.add_source_path(page)
+        built.append(page)
+
+    # Other plugins (i18n_subsites) handle this signal too, in no set order,
+    # so the pages read from files and their translations are left as they
+    # are: the built pages, which have none, are only merged in. The list
+    # is sorted in place, as the context shares it.
+    generator.pages.extend(built)
+    sort_pages(generator.pages, settings['PAGE_ORDER_BY'])
+    logger.info('Built %d pages from the datastore', len(built))
+
+
+def sort_pages(pages, order_by):
+    """Sort `pages` in place as process_translations orders them."""
+
+    pages.sort(key=attrgetter('slug'))
+    if not order_by:
+        return
+    if callable(order_by):
+        pages.sort(key=order_by)
+        return
+
+    reverse = order_by.startswith('reversed-')
+    if reverse:
+        order_by = order_by.replace('reversed-', '', 1)
+    if order_by == 'basename':
+        key = lambda page: os.path.basename(page.source_path or '')
+    elif order_by == 'slug' and not reverse:
+        return
+    else:
+        key = attrgetter(order_by)
+
+    try:
+        pages.sort(key=key, reverse=reverse)
+    except AttributeError:
+        pages.sort(key=attrgetter('slug'))
+
+
+def register():
+    signals.readers_init.connect(add_reader)
+    signals.page_generator_init.connect(exclude_sources)
+    signals.page_generator_finalized.connect(pages)
+
+
+place_overview_template = u"""type: {display_type}
+template: {display_type}
+title: Place overview
+slug: place
+year: {year}
+alias: /country/
+"""
+
+
+place_overview_historical_template = u"""type: {display_type}
+template: {display_type}
+title: Place overview {year}
+slug: place/{year}
+year: {year}
+"""
+
+
+dataset_overview_template = u"""type: {display_type}
+template: {display_type}
+title: Dataset overview
+slug: dataset
+year: {year}
+"""
+
+
+dataset_overview_historical_template = u"""type: {display_type}
+template: {display_type}
+title: Dataset overview {year}
+slug: dataset/{year}
+year: {year}
+"""
+
+
+place_template = u"""type: {display_type}
+template: {display_type}
+title: {place_name}
+slug: place/{place_slug}
+place: {place_id}
+year: {year}
+alias: /country/overview/{place_encname}/
+"""
+
+
+place_historical_template = u"""type: {display_type}
+template: {display_type}
+title: {place_name}
+slug: place/{place_slug}/{year}
+place: {place_id}
+year: {year}
+"""
+
+
+place_dataset_template = u"""type: {display_type}
+template: {display_type}
+title: {place_name} / {dataset_name}
+slug: place/{place_slug}/{dataset_id}
+place: {place_id}
+dataset: {dataset_id}
+year: {year}
+fast: true
+alias: /country/overview/{place_encname}/{dataset_id}/
+"""
+
+
+place_dataset_historical_template = u"""type: {display_type}
+template: {display_type}
+title: {place_name} / {dataset_name} ({year})
+slug: place/{place_slug}/{dataset_id}/{year}
+place: {place_id}
+dataset: {dataset_id}
+year: {year}
+fast: true
+"""
+
+
+dataset_template = u"""type: {display_type}
+template: {display_type}
+title: {dataset_name}
+slug: dataset/{dataset_slug}
+dataset: {dataset_slug}
+year: {year}
+alias: /country/dataset/{dataset_slug}/
+"""
+
+
+dataset_historical_template = u"""type: {display_type}
+template: {display_type}
+title: {dataset_name}
+slug: dataset/{dataset_slug}/{year}
+dataset: {dataset_slug}
+year: {year}
+"""
@@ -0,0 +1,8 @@
+"""Opt-in timing of Jinja filters and page renders for Pelican.
+
+Writes a report of where build time goes, see INSTRUMENTATION.
+
+"""
+
+
+from .instrumentation import *
@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import functools
+import unicodecsv as csv
+from pelican import signals
+from pelican.contents import Article
+from pelican.writers import Writer
+
+
+logger = logging.getLogger(__name__)
+
+# Timings by (kind, name), where kind is `filter`, `query`, `template` or
+# `page` (see page_kind). `query` rows time lazy queries when they are run,
+# by the filter that returned them.
+# Values are Stat objects. Shared by the main site and i18n subsites.
+_stats = {}
+
+# How many query evaluations are running, so nested ones count once
+_evaluating = [0]
+
+
+class Stat(object):
+
+    """Call count, wall time and result size of one instrumented thing."""
+
+    __slots__ = ('calls', 'total', 'max', 'sized', 'size_total', 'size_max')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.sized = 0
+        self.size_total = 0
+        self.size_max = 0
+
+    def add(self, elapsed, size=None):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if size is not None:
+            self.sized += 1
+            self.size_total += size
+            self.size_max = max(self.size_max, size)
+
+    def mean_size(self):
+        if not self.sized:
+            return ''
+        return '{0:.1f}'.format(float(self.size_total) / self.sized)
+
+
+def record(kind, name, elapsed, size=None):
+    """Add one timing of `name` to the stats."""
+
+    key = (kind, name)
+    if key not in _stats:
+        _stats[key] = Stat()
+    _stats[key].add(elapsed, size)
+
+
+def size_of(value):
+    """Return the number of items in a filter's result, if it is a list.
+
+    Other results are not measured, as taking the length of some (like
+    lazy queries, or the datastore) runs or loads them.
+
+    """
+
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return None
+
+
+def is_query(value):
+    """Tell whether `value` is a lazy query (see utilities/filters.py)."""
+
+    return hasattr(value, 'conditions') and hasattr(value, 'sorts')
+
+
+def page_kind(content):
+    """Return what kind of page `content` is, for the `page` stats.
+
+    Place and dataset pages are told apart by their metadata, whatever
+    template (like `empty` or `na`) renders them.
+
+    """
+
+    if isinstance(content, Article):
+        return 'article'
+    metadata = getattr(content, 'metadata', {})
+    if 'place' in metadata and 'dataset' in metadata:
+        return 'place_dataset'
+    if 'place' in metadata:
+        return 'place'
+    if 'dataset' in metadata:
+        return 'dataset'
+    return 'page'
+
+
+def instrument_filter(name, func):
+    """Return `func` wrapped to record its calls under `name`."""
+
+    if getattr(func, 'instrumented', False):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.time()
+        result = func(*args, **kwargs)
+        record('filter', name, time.time() - start, size_of(result))
+        if is_query(result):
+            instrument_query(type(result))
+            result.instrumented_as = name
+        return result
+
+    wrapper.instrumented = True
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def instrument_query(cls):
+    """Wrap the methods that run the lazy query class `cls`, once.
+
+    Runs are recorded as `query` rows, by the filter that returned the
+    query, with the number of results.
+
+    """
+
+    if cls.__dict__.get('instrumented', False):
+        return
+    for method in ('all', 'head'):
+        setattr(cls, method, instrument_evaluation(cls.__dict__[method]))
+    cls.instrumented = True
+
+
+def instrument_evaluation(func):
+    """Return the query method `func` wrapped to record its runs."""
+
+    @functools.wraps(func)
+    def wrapper(query, *args, **kwargs):
+        # kept results, and runs within runs, cost next to nothing
+        if _evaluating[0] or query._result is not None:
+            return func(query, *args, **kwargs)
+        _evaluating[0] += 1
+        start = time.time()
+        try:
+            result = func(query, *args, **kwargs)
+        finally:
+            _evaluating[0] -= 1
+        record('query', getattr(query, 'instrumented_as', 'query'),
+               time.time() - start, size_of(result))
+        return result
+
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+class InstrumentedWriter(Writer):
+
+    """A Writer that records render time per template and kind of page."""
+
+    def write_file(self, name, template, context, *args, **kwargs):
+        start = time.time()
+        try:
+            return super(InstrumentedWriter, self).write_file(
+                name, template, context, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            record('template', template.name, elapsed)
+            content = kwargs.get('page') or kwargs.get('article')
+            if content is not None:
+                record('page', page_kind(content), elapsed)
+
+
+def enabled(settings):
+    return settings.get('INSTRUMENTATION', {}).get('enabled', False)
+
+
+def instrument(pelican_object):
+    """Wrap every filter in JINJA_FILTERS, if instrumentation is on."""
+
+    settings = pelican_object.settings
+    if not enabled(settings):
+        return
+
+    settings['JINJA_FILTERS'] = dict(
+        (name, instrument_filter(name, func)) for
+        name, func in settings.get('JINJA_FILTERS', {}).items())
+
+
+def get_writer(pelican_object):
+    if enabled(pelican_object.settings):
+        return InstrumentedWriter
+
+
+def write_report(pelican_object):
+    """Write the stats so far as CSV, slowest first, and log the top few.
+
+    Stats add up over the main site, its subsites and any autoreloads, so
+    the last report written holds all of them.
+
+    """
+
+    settings = pelican_object.settings
+    if not enabled(settings) or not _stats:
+        return
+
+    rows = sorted(_stats.items(), key=lambda item: item[1].total,
+                  reverse=True)
+    path = settings['INSTRUMENTATION']['report']
+    dirname = os.path.dirname(path)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+
+    with open(path, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(['kind', 'name', 'calls', 'total', 'mean', 'max',
+                         'mean_size', 'max_size'])
+        for (kind, name), stat in rows:
+            writer.writerow([
+                kind, name, stat.calls, '{0:.6f}'.format(stat.total),
+                '{0:.6f}'.format(stat.total / stat.calls),
+                '{0:.6f}'.format(stat.max), stat.mean_size(),
+                stat.size_max if stat.sized else ''])
+
+    for (kind, name), stat in rows[:10]:
+        logger.info('%s %s: %d calls, %.3fs total, %.3fs max', kind, name,
+                    stat.calls, stat.total, stat.max)
+    logger.info('Instrumentation report written to %s', path)
+
+
+def register():
+    signals.initialized.connect(instrument)
+    signals.get_writer.connect(get_writer)
+    signals.finalized.connect(write_report)
@@ -0,0 +1,179 @@
+"""A local stand-in for the census API, for tests and benchmarks.
+
+Serves canned json responses, with ETag and Last-Modified headers, and
+answers conditional requests with 304 Not Modified. To replay the
+responses recorded by `odi prepare`, with some latency:
+
+    python tests/census.py tmp/http --port 8765 --latency 0.2
+
+and point ODI['database'] at http://127.0.0.1:8765/ with the same paths.
+
+"""
+
+import sys
+import json
+import time
+import urllib
+import hashlib
+import urlparse
+import threading
+import collections
+import email.utils
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+import click
+
+
+def route(path, params=None):
+    """Return the key of a request for a path and query params."""
+
+    params = sorted((params or {}).items())
+    return path + ('?' + urllib.urlencode(params) if params else '')
+
+
+class Response(object):
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+        self.last_modified = email.utils.formatdate(usegmt=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        census = self.server.census
+        time.sleep(census.latency)
+
+        url = urlparse.urlparse(self.path)
+        key = route(url.path, dict(urlparse.parse_qsl(url.query)))
+        response = (census.responses.get(key) or
+                    census.responses.get(route(url.path)))
+        with census.lock:
+            failures = (census.failures.get(key) or
+                        census.failures.get(route(url.path)))
+            failure = failures.pop(0) if failures else None
+        # If-Modified-Since only counts without If-None-Match (RFC 7232)
+        if failure is not None:
+            status = failure
+            response = None
+        elif response is None:
+            status = 404
+        elif 'If-None-Match' in self.headers:
+            status = 304 if (self.headers['If-None-Match'] ==
+                             response.etag) else 200
+        elif (self.headers.get('If-Modified-Since') ==
+                response.last_modified):
+            status = 304
+        else:
+            status = 200
+
+        with census.lock:
+            census.served[status] += 1
+
+        self.send_response(status)
+        if response is not None:
+            self.send_header('ETag', response.etag)
+            self.send_header('Last-Modified', response.last_modified)
+        if status == 200:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response.body)))
+            self.end_headers()
+            self.wfile.write(response.body)
+        else:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class CensusServer(object):
+
+    """Canned census responses, served on localhost.
+
+    Responses are added by path, and by query params too if given, which
+    then only match requests with those params. The number of requests
+    served so far, by status code, is kept in `served`. Failures can be
+    queued for a path, to be served before its response.
+
+    """
+
+    def __init__(self, latency=0, port=0):
+        self.latency = latency
+        self.responses = {}
+        self.failures = {}
+        self.served = collections.Counter()
+        self.lock = threading.Lock()
+        self.server = Server(('127.0.0.1', port), Handler)
+        self.server.census = self
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def add(self, path, results, params=None):
+        """Serve `results` for requests to a path, as the census API does."""
+
+        self.add_body(path, json.dumps({'results': results}), params)
+
+    def add_body(self, path, body, params=None):
+        self.responses[route(path, params)] = Response(body)
+
+    def fail(self, path, *statuses, **kwargs):
+        """Answer the next requests to a path with `statuses`, in turn."""
+
+        key = route(path, kwargs.get('params'))
+        self.failures.setdefault(key, []).extend(statuses)
+
+    def add_records(self, records):
+        """Serve responses recorded by services.data.ResponseCache."""
+
+        for record in records:
+            self.add_body(urlparse.urlparse(record['url']).path,
+                          record['body'].encode('utf-8'), record['params'])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+@click.command()
+@click.argument('records', type=click.Path(exists=True, file_okay=False))
+@click.option('--port', default=8765, help='Port to listen on.')
+@click.option('--latency', default=0.0, help='Seconds to wait per request.')
+def main(records, port, latency):
+    """Serve the responses recorded in RECORDS, like tmp/http."""
+
+    sys.path.insert(0, 'cli')
+    from odi.services.data import ResponseCache
+
+    census = CensusServer(latency=latency, port=port)
+    census.add_records(ResponseCache(records).records())
+    click.echo('Serving {0} responses on {1}'.format(len(census.responses),
+                                                    census.url))
+    census.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
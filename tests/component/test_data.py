@@ -0,0 +1,113 @@
+import os
+import sys
+import copy
+import shutil
+import tempfile
+import unittest
+from importlib import import_module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'cli'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+component = import_module('odi.services.data')
+census = import_module('census')
+
+
+class DataTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        self.odi = copy.deepcopy(component.config.ODI)
+        self.tmp_path = tempfile.mkdtemp()
+        self.census = census.CensusServer().start()
+        self.census.add('/api/places/2015.json', [{'id': 'gb'}])
+        self.census.add('/api/places/2014.json', [{'id': 'au'}])
+        component.config.ODI['tmp_path'] = self.tmp_path
+        component.config.ODI['database'] = {
+            'places': self.census.url + '/api/places/{year}.json'}
+        component.config.ODI['exclude'] = {}
+        component.config.ODI['fetch']['backoff'] = 0
+        component.cache.clear()
+        del component.session[:]
+
+    def tearDown(self):
+        self.census.stop()
+        shutil.rmtree(self.tmp_path)
+        component.config.ODI.clear()
+        component.config.ODI.update(self.odi)
+        component.cache.clear()
+        del component.session[:]
+        component.offline = False
+
+    # Actions
+
+    def test_load_items_revalidates(self):
+        self.assertEqual(component.load_items('places', year=u'2015'),
+                         [{'id': 'gb'}])
+        component.cache.clear()
+        self.assertEqual(component.load_items('places', year=u'2015'),
+                         [{'id': 'gb'}])
+        self.assertEqual(self.census.served, {200: 1, 304: 1})
+
+    def test_load_items_refetches_changed(self):
+        component.load_items('places', year=u'2015')
+        self.census.add('/api/places/2015.json', [{'id': 'nz'}])
+        component.cache.clear()
+        self.assertEqual(component.load_items('places', year=u'2015'),
+                         [{'id': 'nz'}])
+        self.assertEqual(self.census.served, {200: 2})
+
+    def test_load_many(self):
+        component.load_many([('places', u'2015', True),
+                             ('places', u'2014', True)])
+        self.assertEqual(self.census.served, {200: 2})
+        self.assertEqual(component.load_items('places', year=u'2014'),
+                         [{'id': 'au'}])
+        self.assertEqual(self.census.served, {200: 2})
+
+    def test_load_items_retries(self):
+        self.census.fail('/api/places/2015.json', 503)
+        self.assertEqual(component.load_items('places', year=u'2015'),
+                         [{'id': 'gb'}])
+        self.assertEqual(self.census.served, {503: 1, 200: 1})
+
+    def test_load_many_failing(self):
+        self.assertRaises(component.requests.HTTPError, component.load_many,
+                          [('places', u'2015', True),
+                           ('places', u'2013', True)])
+        self.assertEqual(self.census.served, {200: 1, 404: 1})
+        self.assertEqual(component.load_items('places', year=u'2015'),
+                         [{'id': 'gb'}])
+        # Kept, or at least recorded, despite the other failing
+        self.assertEqual(self.census.served[200], 1)
+
+    def test_get_session_shared(self):
+        pool = component.ThreadPool(8)
+        try:
+            sessions = pool.map(lambda _: component.get_session(), range(8))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(len(set(map(id, sessions))), 1)
+        self.assertEqual(len(component.session), 1)
+
+    def test_offline(self):
+        component.load_items('places', year=u'2015')
+        component.cache.clear()
+        component.offline = True
+        self.assertEqual(component.load_items('places', year=u'2015'),
+                         [{'id': 'gb'}])
+        self.assertRaises(component.OfflineError, component.load_items,
+                          'places', year=u'2014')
+        self.assertEqual(self.census.served, {200: 1})
+
+    def test_replay_records(self):
+        component.load_items('places', year=u'2015')
+        records = list(component.get_response_cache().records())
+        with census.CensusServer() as replay:
+            replay.add_records(records)
+            component.config.ODI['database']['places'] = (
+                replay.url + '/api/places/{year}.json')
+            component.cache.clear()
+            self.assertEqual(component.load_items('places', year=u'2015'),
+                             [{'id': 'gb'}])
+            self.assertEqual(replay.served, {200: 1})
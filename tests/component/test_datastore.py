@@ -0,0 +1,209 @@
+import datetime
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from importlib import import_module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'plugins'))
+component = import_module('datastore')
+
+
+class DataStoreTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.config = {
+            'DATASTORE': {
+                'location': self.location,
+                'formats': ['.csv'],
+                'intrafield_delimiter': '~*',
+                'true_strings': ['TRUE', 'True', 'true'],
+                'false_strings': ['FALSE', 'False', 'false'],
+                'none_strings': ['NULL', 'null', ''],
+            }
+        }
+        self.write('places.csv', 'id,name\nau,Australia\ngb,United Kingdom\n')
+
+    def tearDown(self):
+        component.invalidate()
+        shutil.rmtree(self.location)
+
+    def write(self, name, content):
+        path = os.path.join(self.location, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    # Actions
+
+    def test_build_cleans_rows(self):
+        self.write('entries.csv', 'Place,dataset,Is-Open,dataset,tags\n'
+                                  'au,x,true,spending,a~*b\n'
+                                  'gb,x, NULL ,budget, c \n')
+        entries = component.DataStore(self.config).build()['entries']
+        self.assertEqual(entries.headers,
+                         ['place', 'dataset', 'isopen', 'tags'])
+        self.assertEqual(entries.dict[0],
+                         {'place': 'au', 'dataset': 'spending',
+                          'isopen': True, 'tags': ['a', 'b']})
+        self.assertEqual(entries.dict[1],
+                         {'place': 'gb', 'dataset': 'budget',
+                          'isopen': None, 'tags': 'c'})
+
+    def test_build_materializes_rows(self):
+        places = component.DataStore(self.config).build()['places']
+        place = places.rows[1]
+        self.assertEqual(place['name'], 'United Kingdom')
+        self.assertEqual(place.name, 'United Kingdom')
+        self.assertEqual(dict(place.items()), places.dict[1])
+        self.assertRaises(KeyError, lambda: place['missing'])
+        self.assertRaises(AttributeError, setattr, place, 'name', 'UK')
+
+    def test_build_coerces_schema(self):
+        self.write('entries.csv', 'place,year,score,timestamp\n'
+                                  'au,2014,0,2014-11-01T10:00:00\n'
+                                  'gb,2014,n/a,\n')
+        self.config['DATASTORE']['schema'] = {
+            'entries': {'year': 'key', 'score': 'int',
+                        'timestamp': 'datetime'},
+        }
+        entries = component.DataStore(self.config).build()['entries']
+        au, gb = entries.rows
+        self.assertEqual(au.score, 0)
+        self.assertEqual(au.timestamp, datetime.datetime(2014, 11, 1, 10))
+        self.assertIs(au.year, gb.year)
+        self.assertEqual(gb.score, 'n/a')
+        self.assertIsNone(gb.timestamp)
+        self.assertEqual(entries[0], ('au', '2014', '0', '2014-11-01T10:00:00'))
+
+    def test_build_indexes(self):
+        self.config['DATASTORE']['indexes'] = {
+            'places': [('id',), ('id', 'name')],
+            'missing': [('id',)],
+        }
+        datastore = component.DataStore(self.config).build()
+        index = datastore.index['places']
+        self.assertEqual(index['by_id']['gb'], (datastore['places'].rows[1],))
+        self.assertEqual(index['by_id_name'][('au', 'Australia')],
+                         (datastore['places'].rows[0],))
+        self.assertEqual(index['by_id']['nz'], ())
+        self.assertNotIn('missing', datastore.index)
+
+    def test_build_renders_markdown(self):
+        self.write('entries.csv', 'place,details\nau,*a*\ngb,\nnz,*a*\n')
+        self.config['DATASTORE']['markdown'] = {'entries': ['details']}
+        self.config['DATASTORE']['indexes'] = {'entries': [('place',)]}
+        converted = []
+        self.config['JINJA_FILTERS'] = {
+            'markdown': lambda text: converted.append(text) or text.upper()}
+        datastore = component.DataStore(self.config).build()
+        au = datastore.index['entries']['by_place']['au'][0]
+        self.assertEqual(au.details_html, '*A*')
+        self.assertIs(au, datastore['entries'].rows[0])
+        self.assertIsNone(datastore['entries'].rows[1].details_html)
+        self.assertEqual(converted, ['*a*'])
+        self.assertEqual(datastore['entries'].headers, ['place', 'details'])
+
+    def test_normalizer_skips_plain_columns(self):
+        normalizer = component.Normalizer(self.config['DATASTORE'])
+        self.assertEqual(normalizer.compile(set(['au', 'gb'])), {})
+        self.assertEqual(normalizer.compile(set(['true', ' x', 'a~*b'])),
+                         {'true': True, ' x': 'x', 'a~*b': ('a', 'b')})
+
+    def test_build_in_parallel(self):
+        self.write('datasets.csv', 'id,title\nspending,Spending\n')
+        serial = component.DataStore(self.config).process()
+        component.invalidate()
+        self.config['DATASTORE']['workers'] = 2
+        parallel = component.DataStore(self.config).process()
+        self.assertEqual([key for key, _ in parallel], ['datasets', 'places'])
+        self.assertEqual([dataset.dict for _, dataset in serial],
+                         [dataset.dict for _, dataset in parallel])
+
+    def test_build_is_shared(self):
+        first = component.DataStore(self.config).build()
+        second = component.DataStore(self.config).build()
+        self.assertIs(first['places'], second['places'])
+
+    def test_build_reparses_changed_source(self):
+        first = component.DataStore(self.config).build()['places']
+        self.write('places.csv', 'id,name\nau,Australia\n')
+        second = component.DataStore(self.config).build()['places']
+        self.assertIsNot(first, second)
+        self.assertEqual(len(second), 1)
+
+    def test_build_reads_snapshot(self):
+        self.config['DATASTORE']['snapshots'] = os.path.join(self.location,
+                                                             'snapshots')
+        first = component.DataStore(self.config).build()['places']
+        component.invalidate()
+        store = component.DataStore(self.config)
+        store._extract_data = None  # parsing again would fail
+        second = store.build()['places']
+        self.assertEqual(first.dict, second.dict)
+        self.assertEqual(len(os.listdir(self.config['DATASTORE']['snapshots'])), 1)
+
+    def test_build_reparses_broken_snapshot(self):
+        location = os.path.join(self.location, 'snapshots')
+        self.config['DATASTORE']['snapshots'] = location
+        store = component.DataStore(self.config)
+        snapshot = store.get_snapshot(self.location + '/places.csv')
+        os.makedirs(location)
+        # truncated, and referring to a class or module that is gone
+        for broken in ('truncated', 'cdatastore\nGone\n.', 'cgone\nGone\n.'):
+            with open(snapshot, 'wb') as f:
+                f.write(broken)
+            places = store.parse(self.location + '/places.csv')
+            self.assertEqual(len(places), 2)
+            self.assertEqual(os.listdir(location),
+                             [os.path.basename(snapshot)])
+            with open(snapshot, 'rb') as f:
+                self.assertNotEqual(f.read(), broken)
+
+    def test_build_removes_unwritten_snapshot(self):
+        location = os.path.join(self.location, 'snapshots')
+        self.config['DATASTORE']['snapshots'] = location
+        store = component.DataStore(self.config)
+        snapshot = store.get_snapshot(self.location + '/places.csv')
+        # renaming over a directory fails
+        os.makedirs(os.path.join(snapshot, 'taken'))
+        self.assertRaises(OSError, lambda: store.build()['places'])
+        self.assertEqual(os.listdir(location), [os.path.basename(snapshot)])
+
+    def test_build_is_lazy(self):
+        self.write('entries.csv', 'place,year\nau,2014\n')
+        self.write('geo.json', '{}')
+        self.config['DATASTORE']['indexes'] = {'places': [('id',)]}
+        store = component.DataStore(self.config)
+        store._extract_data = None  # parsing would fail
+        datastore = store.build()
+        self.assertEqual(datastore.used, set())
+        self.assertNotIn('geo', datastore)
+        self.assertRaises(KeyError, lambda: datastore['missing'])
+        store._extract_data = component.DataStore(self.config)._extract_data
+        self.assertEqual(len(datastore.index['places']['by_id']), 2)
+        self.assertEqual(datastore.used, set(['places']))
+        self.assertEqual(sorted(datastore), ['entries', 'places'])
+        self.assertEqual(datastore.used, set(['entries', 'places']))
+
+    def test_refresh(self):
+        store = component.DataStore(self.config)
+        self.write('datasets.csv', 'id,title\nspending,Spending\n')
+        places = store.build()['places']
+        store.build()['datasets']
+        generation = component.generation()
+        self.assertEqual(store.refresh(), [])
+        self.assertEqual(component.generation(), generation)
+        source = self.write('places.csv', 'id,name\nau,Australia\n')
+        self.assertEqual(store.refresh(), [source])
+        self.assertEqual(component.generation(), generation + 1)
+        self.assertIsNot(store.build()['places'], places)
+
+    def test_invalidate(self):
+        first = component.DataStore(self.config).build()['places']
+        component.invalidate()
+        second = component.DataStore(self.config).build()['places']
+        self.assertIsNot(first, second)
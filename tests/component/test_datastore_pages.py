@@ -0,0 +1,143 @@
+import os
+import sys
+import copy
+import shutil
+import tempfile
+import unittest
+from importlib import import_module
+from pelican.settings import DEFAULT_CONFIG
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'plugins'))
+component = import_module('datastore_pages')
+
+
+class DatastorePagesTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        self.places = [{'id': 'gb', 'name': 'United Kingdom', 'slug': 'gb'}]
+        self.datasets = [{'id': 'budget', 'title': 'Budget'}]
+        self.entries = [{'place': 'gb', 'dataset': 'budget', 'year': u'2015'}]
+
+    def sources(self):
+        return dict(component.page_sources(self.places, self.datasets,
+                                           self.entries, [u'2015', u'2014'],
+                                           u'2015'))
+
+    # Actions
+
+    def test_page_sources(self):
+        sources = self.sources()
+        self.assertEqual(sorted(sources), [
+            'dataset/2014/index.md', 'dataset/budget/2014/index.md',
+            'dataset/budget/index.md', 'dataset/index.md',
+            'place/2014/index.md', 'place/gb/2014/index.md',
+            'place/gb/budget/2014/index.md', 'place/gb/budget/index.md',
+            'place/gb/index.md', 'place/index.md'])
+        place = component.parse_header(sources['place/gb/index.md'])
+        self.assertEqual(place['type'], 'place')
+        self.assertEqual(place['alias'], '/country/overview/United%20Kingdom/')
+        historical = component.parse_header(
+            sources['place/gb/budget/2014/index.md'])
+        self.assertEqual(historical['type'], 'na')
+        self.assertEqual(historical['title'], 'United Kingdom / Budget (2014)')
+
+    def test_page_sources_without_shared(self):
+        sources = component.page_sources(self.places, self.datasets,
+                                         self.entries, [u'2015'], u'2015',
+                                         shared=False)
+        self.assertEqual(sorted(path for path, _ in sources),
+                         ['place/gb/budget/index.md', 'place/gb/index.md'])
+
+    def test_parse_shard(self):
+        self.assertEqual(component.parse_shard('3/8'), (3, 8))
+        self.assertIsNone(component.parse_shard(None))
+        for spec in ('0/8', '9/8', '3', 'a/b'):
+            self.assertRaises(ValueError, component.parse_shard, spec)
+
+    def test_in_shard(self):
+        ids = [u'place{0}'.format(i) for i in range(100)]
+        shards = [[i for i in ids if component.in_shard(i, (index, 3))]
+                  for index in (1, 2, 3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(ids))
+        self.assertTrue(all(shards))
+        self.assertTrue(component.is_shared((1, 3)))
+        self.assertFalse(component.is_shared((2, 3)))
+
+    def test_parse_header(self):
+        self.assertEqual(component.parse_header(u'Title: A: B\nyear:2015\n\n'),
+                         {'title': 'A: B', 'year': '2015'})
+        self.assertIsNone(component.parse_header(u'title: A\n\nBody\n'))
+        self.assertIsNone(component.parse_header(u'tags: a\ntags: b\n'))
+        self.assertIsNone(component.parse_header(u'title: A\n    B\n'))
+
+    def test_front_matter_reader(self):
+        settings = copy.deepcopy(DEFAULT_CONFIG)
+        reader = component.FrontMatterReader(settings)
+        location = tempfile.mkdtemp()
+        try:
+            path = os.path.join(location, 'index.md')
+            for source in (u'title: A\ntags: a, b\nfast: true\n',
+                           u'title: A\n\n*Body*\n', u'summary: *A*\n'):
+                with open(path, 'w') as f:
+                    f.write(source)
+                self.assertEqual(
+                    reader.read(path),
+                    component.MarkdownReader(settings).read(path))
+        finally:
+            shutil.rmtree(location)
+
+    def test_build_page(self):
+        class Generator(object):
+            settings = copy.deepcopy(DEFAULT_CONFIG)
+            path = '/content'
+            context = {}
+        generator = Generator()
+        generator.settings['PAGE_SAVE_AS'] = '{slug}/index.html'
+        sources = self.sources()
+        page = component.build_page(
+            generator, component.BaseReader(generator.settings),
+            'place/gb/budget/index.md', sources['place/gb/budget/index.md'])
+        self.assertEqual(page.slug, 'place/gb/budget')
+        self.assertEqual(page.save_as, 'place/gb/budget/index.html')
+        self.assertEqual(page.template, 'place_dataset')
+        self.assertEqual(page.metadata['fast'], 'true')
+        self.assertEqual(page.source_path, '/content/pages/place/gb/budget/index.md')
+
+    def test_pages_merges_into_generator(self):
+        class Table(object):
+            def __init__(self, rows):
+                self.rows = rows
+        class Generator(object):
+            settings = copy.deepcopy(DEFAULT_CONFIG)
+            path = '/content'
+            def add_source_path(self, page):
+                self.added.append(page)
+        generator = Generator()
+        generator.added = []
+        generator.settings['PAGE_SAVE_AS'] = '{slug}/index.html'
+        generator.settings['DATASTORE'] = {'pages': {'enabled': True}}
+        generator.settings['ODI'] = {'years': [u'2015'],
+                                     'current_year': u'2015'}
+        generator.context = {'datastore': {
+            'places': Table(self.places), 'datasets': Table(self.datasets),
+            'entries': Table(self.entries)}}
+        about = component.Page(u'', {'title': 'About', 'slug': 'about'},
+                               settings=generator.settings,
+                               source_path='/content/pages/about.md')
+        translation = object()
+        about.translations = [translation]
+        generator.pages = existing = [about]
+        generator.translations = []
+        component.pages(generator)
+        self.assertIs(generator.pages, existing)
+        self.assertEqual(generator.translations, [])
+        self.assertEqual(about.translations, [translation])
+        self.assertEqual([page.slug for page in generator.pages], [
+            'about', 'dataset', 'dataset/budget', 'place', 'place/gb',
+            'place/gb/budget'])
+        self.assertEqual(len(generator.added), 5)
+
+    def test_select(self):
+        self.assertEqual(component.select(self.places, []), self.places)
+        self.assertEqual(component.select(self.places, ['au']), [])
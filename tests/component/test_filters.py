@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 from importlib import import_module
 component = import_module('utilities.filters')
@@ -17,3 +20,205 @@ class SelectTest(unittest.TestCase):
         self.assertEqual(func(items, 'entries', dataset='transport', year='2014'), [item2])
         self.assertEqual(func(items, 'entries', dataset='transport', year='2015'), [item1])
         self.assertEqual(func(items, 'entries', dataset='budget'), [])
+
+    def test_reset_caches(self):
+        component.search_cache.clear()
+        component.search(QueryTest.Rows([{'place': 'au'}]), 'reset',
+                         place='au')
+        component.reset_caches(component.cache_generation[0])
+        self.assertEqual(len(component.search_cache), 1)
+        component.reset_caches(component.cache_generation[0] + 1)
+        self.assertEqual(len(component.search_cache), 0)
+
+    def test_search_notices_new_items(self):
+        func = component.search
+        self.assertEqual(func([{'place': 'au'}], 'new', place='au'),
+                         [{'place': 'au'}])
+        self.assertEqual(func([{'place': 'gb'}, {'place': 'au'}], 'new',
+                              place='gb'), [{'place': 'gb'}])
+
+
+    def test_search_tells_lists_apart(self):
+        func = component.search
+        item = {'place': 'au'}
+        first = QueryTest.Rows([item, {'place': 'gb'}])
+        second = QueryTest.Rows([item, {'place': 'nz'}])
+        self.assertEqual(func(first, 'apart', place='gb'), [{'place': 'gb'}])
+        self.assertEqual(func(second, 'apart', place='gb'), [])
+        self.assertEqual(func([item, {'place': 'nz'}], 'apart', place='nz'),
+                         [{'place': 'nz'}])
+        self.assertEqual(func(component.query(second), 'apart', place='nz'),
+                         [{'place': 'nz'}])
+
+
+class QueryTest(unittest.TestCase):
+
+    # Helpers
+
+    class Rows(tuple):
+        lookups = []
+
+        def get_index(self, columns):
+            self.lookups.append(columns)
+            index = {}
+            for row in self:
+                index.setdefault(row[columns[0]], []).append(row)
+            return index
+
+    # Actions
+
+    def test_chain(self):
+        item1 = {'place': 'au', 'year': '2014', 'score': '5'}
+        item2 = {'place': 'au', 'year': '2015', 'score': '10'}
+        item3 = {'place': 'gb', 'year': '2015', 'score': '0'}
+        items = [item1, item2, item3]
+        query = component.natsort(items, 'score', reverse=True)
+        query = component.where(query, 'year', '2015')
+        self.assertIsInstance(query, component.Query)
+        self.assertEqual(query.conditions, (('year', '==', '2015'),))
+        self.assertEqual(query, [item2, item3])
+        self.assertEqual(len(query), 2)
+        self.assertEqual(component.first_or_default(
+            component.where(query, 'place', 'nz'), None), None)
+        self.assertFalse(component.where(items, 'score', '1'))
+
+    def test_index(self):
+        rows = self.Rows([{'place': 'au', 'year': '2014'},
+                          {'place': 'gb', 'year': '2014'},
+                          {'place': 'gb', 'year': '2015'}])
+        query = component.where(component.where(rows, 'year', '2014'),
+                                'place', 'gb')
+        self.assertEqual(component.first_or_default(query, None), rows[1])
+        self.assertEqual(rows.lookups, [('year',), ('place',)])
+
+    def test_sorted_view(self):
+        rows = self.Rows([{'id': 'a', 'score': '9'}, {'id': 'b', 'score': '10'},
+                          {'id': 'c', 'score': '9'}, {'id': 'd', 'score': '1'}])
+        ordered = [rows[1], rows[0], rows[2], rows[3]]
+        query = component.natsort(rows, 'score', reverse=True)
+        self.assertEqual(query, ordered)
+        self.assertEqual(component.where(query, 'score', '9'),
+                         [rows[0], rows[2]])
+        self.assertEqual(component.where(query, 'id', 'c').first(), rows[2])
+        self.assertIs(component.natsort(rows, 'score', reverse=True)._view(),
+                      query._view())
+        self.assertEqual(component.top(rows, 3, 'score', reverse=True),
+                         ordered[:3])
+        self.assertEqual(component.top(list(rows), 2, 'score'),
+                         [rows[3], rows[0]])
+
+
+class JoinTest(unittest.TestCase):
+
+    # Actions
+
+    def test_group_by(self):
+        item1 = {'place': 'au', 'year': '2014'}
+        item2 = {'place': 'gb', 'year': '2014'}
+        item3 = {'place': 'au', 'year': '2015'}
+        groups = component.group_by([item1, item2, item3], 'place')
+        self.assertEqual(groups['au'], [item1, item3])
+        self.assertEqual(groups['nz'], [])
+        groups = component.group_by([item1, item2, item3], 'place', 'year')
+        self.assertEqual(groups[('au', '2015')], [item3])
+
+    def test_lookup(self):
+        item1 = {'id': 'au', 'name': 'Australia'}
+        item2 = {'id': 'au', 'name': 'Duplicate'}
+        found = component.lookup([item1, item2], 'id')
+        self.assertIs(found['au'], item1)
+        self.assertIsNone(found['nz'])
+
+    def test_cached(self):
+        rows = QueryTest.Rows([{'id': 'au', 'year': '2014'}])
+        query = component.where(rows, 'year', '2014')
+        self.assertIs(component.lookup(query, 'id'),
+                      component.lookup(component.where(rows, 'year', '2014'),
+                                       'id'))
+        self.assertIsNot(component.lookup(list(rows), 'id'),
+                         component.lookup(list(rows), 'id'))
+
+
+class IndexCacheTest(unittest.TestCase):
+
+    # Actions
+
+    def test(self):
+        cache = component.IndexCache('test', maxsize=2)
+        self.assertEqual(cache.get('a', lambda: 1), 1)
+        self.assertEqual(cache.get('b', lambda: 2), 2)
+        self.assertEqual(cache.get('a', lambda: None), 1)
+        self.assertEqual(cache.get('c', lambda: 3), 3)
+        self.assertEqual(list(cache.indexes), ['a', 'c'])
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (1, 3, 1))
+        cache.report()
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (0, 0, 0))
+
+
+class MarkdownStoreTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # Actions
+
+    def test(self):
+        store = component.MarkdownStore(self.path, 'v1', maxsize=1)
+        self.assertIsNone(store.get('ab12'))
+        store.set('ab12', u'<p>caf\xe9</p>')
+        self.assertEqual(store.get('ab12'), u'<p>caf\xe9</p>')
+        self.assertIsNone(component.MarkdownStore(self.path, 'v2').get('ab12'))
+        os.utime(store.filepath('ab12'), (0, 0))
+        store.set('cd34', u'<p>b</p>')
+        os.makedirs(os.path.join(self.path, 'v0'))
+        store.prune()
+        self.assertEqual(os.listdir(self.path), ['v1'])
+        self.assertIsNone(store.get('ab12'))
+        self.assertEqual(store.get('cd34'), u'<p>b</p>')
+
+    def test_touch_once_per_build(self):
+        store = component.MarkdownStore(self.path, 'v1')
+        store.set('ab12', u'<p>a</p>')
+        store.get('ab12')
+        os.utime(store.filepath('ab12'), (0, 0))
+        store.get('ab12')
+        self.assertEqual(os.path.getmtime(store.filepath('ab12')), 0)
+        store.prune()
+        store.get('ab12')
+        self.assertNotEqual(os.path.getmtime(store.filepath('ab12')), 0)
+
+    def test_configure(self):
+        class Pelican(object):
+            settings = {'DATASTORE': {'markdown_cache': self.path},
+                        'DEFAULT_LANG': 'en', 'I18N_SUBSITES': {'de': {}}}
+        class Subsite(object):
+            settings = dict(Pelican.settings, DEFAULT_LANG='de')
+        self.assertIsNone(component.markdown_store[0])
+        try:
+            component.configure_markdown_store(Pelican())
+            store = component.markdown_store[0]
+            component.configure_markdown_store(Subsite())
+            self.assertIs(component.markdown_store[0], store)
+            component.markdown_cache.clear()
+            component.markdown(u'*configured*')
+            key = component.hashlib.sha256('*configured*').hexdigest()
+            self.assertEqual(store.get(key), u'<p><em>configured</em></p>')
+            store.maxsize = 0
+            component.prune_markdown_store(Subsite())
+            self.assertEqual(store.get(key), u'<p><em>configured</em></p>')
+            component.prune_markdown_store(Pelican())
+            self.assertIsNone(store.get(key))
+            # every build prunes, under autoreload too
+            store.set('ab12', u'<p>a</p>')
+            component.prune_markdown_store(Pelican())
+            self.assertIsNone(store.get('ab12'))
+        finally:
+            component.markdown_store[0] = None
+            component.markdown_cache.clear()
@@ -0,0 +1,104 @@
+import os
+import sys
+import copy
+import shutil
+import tempfile
+import unittest
+import unicodecsv as csv
+from importlib import import_module
+from jinja2 import DictLoader, Environment
+from pelican.contents import Page
+from pelican.settings import DEFAULT_CONFIG
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'plugins'))
+component = import_module('instrumentation')
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+        component.instrumentation._stats.clear()
+
+    def stat(self, kind, name):
+        return component.instrumentation._stats[(kind, name)]
+
+    # Actions
+
+    def test_instrument_filter(self):
+        func = component.instrument_filter('rest', lambda items: items[1:])
+        self.assertIs(component.instrument_filter('rest', func), func)
+        self.assertEqual(func([1, 2, 3]), [2, 3])
+        self.assertEqual(func([4]), [])
+        stat = self.stat('filter', 'rest')
+        self.assertEqual((stat.calls, stat.size_max, stat.mean_size()),
+                         (2, 2, '1.0'))
+
+    def test_instrument_query(self):
+        class Query(object):
+            conditions = sorts = ()
+            def __init__(self, items):
+                self.items = items
+                self._result = None
+            def all(self):
+                if self._result is None:
+                    self._result = list(self.items)
+                return self._result
+            def head(self, n):
+                return self.all()[:n]
+            def __len__(self):
+                raise AssertionError('queries should not be run')
+        where = component.instrument_filter('where', Query)
+        query = where([1, 2, 3])
+        self.assertEqual(query.head(1), [1])
+        self.assertEqual(query.all(), [1, 2, 3])
+        self.assertEqual(where([4, 5]).all(), [4, 5])
+        stat = self.stat('query', 'where')
+        self.assertEqual((stat.calls, stat.sized, stat.size_max), (2, 2, 2))
+        self.assertEqual(self.stat('filter', 'where').sized, 0)
+
+    def test_size_of(self):
+        self.assertEqual(component.size_of((1, 2, 3)), 3)
+        self.assertIsNone(component.size_of(u'text'))
+        self.assertIsNone(component.size_of({'datastore': 'not measured'}))
+        self.assertIsNone(component.size_of(None))
+
+    def test_page_kind(self):
+        class Content(object):
+            def __init__(self, **metadata):
+                self.metadata = metadata
+        self.assertEqual(component.page_kind(Content(place='gb',
+                                                     dataset='budget')),
+                         'place_dataset')
+        self.assertEqual(component.page_kind(Content(place='gb')), 'place')
+        self.assertEqual(component.page_kind(Content(dataset='budget')),
+                         'dataset')
+        self.assertEqual(component.page_kind(Content()), 'page')
+
+    def test_write_report(self):
+        settings = copy.deepcopy(DEFAULT_CONFIG)
+        settings['INSTRUMENTATION'] = {
+            'enabled': True,
+            'report': os.path.join(self.location, 'report', 'stats.csv')}
+        env = Environment(loader=DictLoader({'place.html': u'{{ page }}'}))
+        writer = component.InstrumentedWriter(self.location, settings)
+        for slug in ('gb', 'au'):
+            page = Page(u'', {'title': slug, 'slug': slug, 'place': slug},
+                        settings=settings)
+            writer.write_file(slug + '.html', env.get_template('place.html'),
+                              {'localsiteurl': ''}, page=page)
+        class Pelican(object):
+            pass
+        pelican_object = Pelican()
+        pelican_object.settings = settings
+        component.write_report(pelican_object)
+        with open(settings['INSTRUMENTATION']['report'], 'rb') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['kind', 'name', 'calls', 'total', 'mean',
+                                   'max', 'mean_size', 'max_size'])
+        self.assertEqual(sorted(row[:3] for row in rows[1:]), [
+            ['page', 'place', '2'], ['template', 'place.html', '2']])
@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from importlib import import_module
+from click.testing import CliRunner
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'cli'))
+component = import_module('odi.actions.merge')
+commands = import_module('odi.commands')
+
+
+class MergeTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.first = self.write('first', {
+            'index.html': 'overview', 'place/gb/index.html': 'gb',
+            'theme/site.css': 'css one'})
+        self.second = self.write('second', {
+            'index.html': 'overview', 'place/au/index.html': 'au',
+            'theme/site.css': 'css two'})
+        self.output = os.path.join(self.location, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def write(self, name, files):
+        root = os.path.join(self.location, name)
+        for relpath, content in files.items():
+            path = os.path.join(root, relpath)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+        return root
+
+    def read(self, relpath):
+        with open(os.path.join(self.output, relpath)) as f:
+            return f.read()
+
+    # Actions
+
+    def test_run(self):
+        counts, conflicts, stale = component.run(
+            [self.first, self.second], self.output)
+        self.assertEqual(counts, {'copied': 4, 'skipped': 2})
+        self.assertEqual(conflicts, [os.path.join('theme', 'site.css')])
+        self.assertEqual(stale, [])
+        self.assertEqual(self.read('theme/site.css'), 'css one')
+        self.assertEqual(self.read('place/au/index.html'), 'au')
+
+    def test_run_stale(self):
+        self.write('output', {'place/nz/index.html': 'nz'})
+        stale = component.run([self.first], self.output)[2]
+        self.assertEqual(stale, [os.path.join('place', 'nz', 'index.html')])
+        stale = component.run([self.first], self.output, clean_slate=True)[2]
+        self.assertEqual(stale, [])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.output, 'place', 'nz')))
+
+    def test_run_overlap(self):
+        for destination in (self.first, os.path.join(self.first, 'place'),
+                            self.location):
+            self.assertRaises(component.OverlapError, component.run,
+                              [self.first, self.second], destination)
+        self.assertEqual(sorted(os.listdir(self.location)),
+                         ['first', 'second'])
+
+    def test_command_non_ascii(self):
+        alias = os.path.join('place', 'C\xc3\xb4te d\'Ivoire', 'index.html')
+        self.write('first', {alias: 'alias'})
+        # The default output path is unicode, the arguments are not
+        config = commands.services.config.get_config(key='ODI')
+        output_path = config['output_path']
+        config['output_path'] = self.output.decode('utf-8')
+        try:
+            result = CliRunner().invoke(commands.cli,
+                                        ['merge', self.first, self.second])
+        finally:
+            config['output_path'] = output_path
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.read(alias), 'alias')
+        self.assertIn('5 copied, 2 skipped.', result.output)
+        self.assertNotIn('Not from any', result.output)
@@ -0,0 +1,100 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from importlib import import_module
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(ROOT, 'cli'))
+sys.path.insert(0, os.path.join(ROOT, 'plugins'))
+sys.path.insert(0, ROOT)
+component = import_module('odi.actions.populate')
+config = import_module('config_default')
+
+
+class PopulateTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        # page sources are written under the working directory
+        self.cwd = os.getcwd()
+        self.location = tempfile.mkdtemp()
+        self.workers = config.ODI['populate_workers']
+        self.chdir('base')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.location)
+        config.ODI['populate_workers'] = self.workers
+
+    def chdir(self, name):
+        path = os.path.join(self.location, name)
+        os.makedirs(path)
+        os.chdir(path)
+        return path
+
+    def run_limited(self, **kwargs):
+        return component.run(limited_places=['gb', 'tw'],
+                             limited_datasets=['statistics'], **kwargs)
+
+    def tree(self, name='base'):
+        root = os.path.join(self.location, name, 'content', 'pages')
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, root)] = f.read()
+        return files
+
+    # Actions
+
+    def test_run_twice(self):
+        counts = self.run_limited()
+        created = counts['created']
+        self.assertTrue(created)
+        self.assertEqual(counts, {'created': created, 'updated': 0,
+                                  'removed': 0, 'unchanged': 0})
+
+        pages = os.path.join(self.location, 'base', 'content', 'pages')
+        with open(os.path.join(pages, 'place', 'gb', 'index.md'), 'w') as f:
+            f.write('changed')
+        stray = os.path.join(pages, 'place', 'zz', '2014')
+        os.makedirs(stray)
+        with open(os.path.join(stray, 'index.md'), 'w') as f:
+            f.write('stray')
+
+        counts = self.run_limited()
+        self.assertEqual(counts, {'created': 0, 'updated': 1, 'removed': 1,
+                                  'unchanged': created - 1})
+        self.assertFalse(os.path.exists(os.path.join(pages, 'place', 'zz')))
+        self.assertEqual(self.run_limited()['unchanged'], created)
+
+    def test_run_limited(self):
+        self.run_limited()
+        names = set(path.split(os.sep)[1] for path in self.tree())
+        self.assertEqual(set(name for name in names if
+                             not name.isdigit() and name != 'index.md'),
+                         set(['gb', 'tw', 'statistics']))
+
+    def test_run_shard(self):
+        component.run(limited_datasets=['statistics'])
+        self.chdir('first')
+        component.run(limited_datasets=['statistics'], shard='1/2')
+        self.chdir('second')
+        component.run(limited_datasets=['statistics'], shard='2/2')
+        first, second = self.tree('first'), self.tree('second')
+        self.assertEqual(set(first) & set(second), set())
+        self.assertIn(os.path.join('dataset', 'index.md'), first)
+        self.assertNotIn(os.path.join('dataset', 'index.md'), second)
+        first.update(second)
+        self.assertEqual(first, self.tree())
+
+    def test_run_workers(self):
+        config.ODI['populate_workers'] = 1
+        self.run_limited()
+        self.chdir('pooled')
+        config.ODI['populate_workers'] = 8
+        self.run_limited()
+        self.assertEqual(self.tree('pooled'), self.tree())
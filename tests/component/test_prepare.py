@@ -0,0 +1,66 @@
+import os
+import sys
+import copy
+import shutil
+import tempfile
+import unittest
+from importlib import import_module
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'cli'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+component = import_module('odi.actions.prepare')
+census = import_module('census')
+data = component.services.data
+
+
+class PrepareTest(unittest.TestCase):
+
+    # Helpers
+
+    def setUp(self):
+        self.odi = copy.deepcopy(data.config.ODI)
+        self.datastore = copy.deepcopy(data.config.DATASTORE)
+        self.tmp_path = tempfile.mkdtemp()
+        self.census = census.CensusServer().start()
+        for year in (u'2015', u'2014'):
+            self.census.add('/api/datasets/{0}.json'.format(year), [
+                {'id': 'budget', 'name': 'Budget', 'relativeScore': 50}])
+            self.census.add('/api/places/{0}.json'.format(year), [
+                {'id': 'gb', 'relativeScore': 50}])
+            self.census.add('/api/entries/{0}.json'.format(year), [
+                {'id': 'gb-budget', 'place': 'gb', 'dataset': 'budget',
+                 'year': year, 'score': 50, 'isOpen': 'Yes',
+                 'submitter': 'a', 'reviewer': 'b'}])
+        self.census.add('/api/questions/2015.json', [{'icon': 'none'}])
+        data.config.ODI['tmp_path'] = self.tmp_path
+        data.config.ODI['years'] = [u'2015', u'2014']
+        data.config.ODI['current_year'] = u'2015'
+        data.config.ODI['exclude'] = {}
+        data.config.ODI['database'] = dict(
+            (entity, self.census.url + '/api/' + entity + '/{year}.json')
+            for entity in ('datasets', 'entries', 'places', 'questions'))
+        data.config.DATASTORE['location'] = self.tmp_path
+        data.cache.clear()
+
+    def tearDown(self):
+        self.census.stop()
+        shutil.rmtree(self.tmp_path)
+        data.config.ODI.clear()
+        data.config.ODI.update(self.odi)
+        data.config.DATASTORE.clear()
+        data.config.DATASTORE.update(self.datastore)
+        data.cache.clear()
+
+    # Actions
+
+    def test_get_wanted(self):
+        wanted = component.get_wanted()
+        self.assertEqual(len(wanted), len(set(wanted)))
+        component.run()
+        self.assertEqual(
+            sorted(data.cache),
+            sorted(data.get_request(*item)[0] for item in wanted))
+        # Requests for the same url may be revalidated, if not in flight
+        self.assertEqual(sum(self.census.served.values()), len(wanted))
+        self.assertEqual(set(self.census.served) - set([200, 304]), set())
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmp_path, 'summary.csv')))
@@ -1,16 +1,28 @@
 """Custom Jinja filters."""
 
 
+import os
 import sys
+import errno
+import heapq
+import shutil
+import logging
+import tempfile
 import operator
 import json
 import jinja2
+import itertools
 import hashlib
 import mdx_urlize as urlize
 import markdown as mdlib
 import natsort as natsortlib
+from blinker import signal
+from collections import OrderedDict
 
-md = mdlib.Markdown(extensions=[urlize.UrlizeExtension()])
+logger = logging.getLogger(__name__)
+
+md_extensions = [urlize.UrlizeExtension()]
+md = mdlib.Markdown(extensions=md_extensions)
 
 operators = {
     '==': operator.eq,
@@ -24,25 +36,452 @@ operators = {
 }
 
 
+# The datastore generation that the caches below were filled from.
+cache_generation = [0]
+
+
+def reset_caches(generation):
+    """Drop cached results if the datastore moved to a new `generation`.
+
+    Connected to the datastore plugin's `datastore_refreshed` signal, so
+    the search index is rebuilt once sources change under `pelican -r`.
+    """
+    if generation != cache_generation[0]:
+        cache_generation[0] = generation
+        search_cache.clear()
+        sort_cache.clear()
+        join_cache.clear()
+        markdown_cache.clear()
+
+signal('datastore_refreshed').connect(reset_caches)
+
+
+class MarkdownStore(object):
+    """Rendered markdown on disk, by the sha256 of its source text.
+
+    Entries live under a directory named for `stamp`, so a change to the
+    markdown setup starts a fresh cache. `prune` removes other stamps and
+    then the least recently used entries beyond `maxsize`. Entries read
+    are marked used once per build, until `prune` starts the next.
+    """
+
+    def __init__(self, path, stamp, maxsize=20000):
+        self.path = path
+        self.root = os.path.join(path, stamp)
+        self.maxsize = maxsize
+        self.touched = set()
+
+    def get(self, key):
+        """Return the html stored for `key`, or None."""
+        filepath = self.filepath(key)
+        try:
+            with open(filepath, 'rb') as f:
+                html = f.read().decode('utf-8')
+            if key not in self.touched:
+                os.utime(filepath, None)
+                self.touched.add(key)
+        except (IOError, OSError):
+            return None
+        return html
+
+    def set(self, key, html):
+        """Store `html` for `key`. Failing to write is not an error."""
+        filepath = self.filepath(key)
+        try:
+            dirname = os.path.dirname(filepath)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmp = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(html.encode('utf-8'))
+            os.rename(tmp, filepath)
+        except (IOError, OSError) as e:
+            logger.debug('Could not cache markdown %s: %s', key, e)
+
+    def filepath(self, key):
+        return os.path.join(self.root, key[:2], key + '.html')
+
+    def prune(self, *args):
+        """Drop other stamps, then the oldest entries beyond maxsize."""
+        self.touched.clear()
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            if os.path.join(self.path, name) != self.root:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+        # other builds sharing the store may remove the same files
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                try:
+                    entries.append((os.path.getmtime(filepath), filepath))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+        entries.sort()
+        for _mtime, filepath in entries[:max(len(entries) - self.maxsize, 0)]:
+            try:
+                os.remove(filepath)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+
+def markdown_stamp():
+    """Return a stamp for the version of markdown and its extensions."""
+    source = os.path.splitext(urlize.__file__)[0] + '.py'
+    with open(source if os.path.exists(source) else urlize.__file__, 'rb') as f:
+        urlize_hash = hashlib.sha1(f.read()).hexdigest()
+    setup = (2, mdlib.version, md.output_format,
+             [type(e).__name__ for e in md_extensions], urlize_hash)
+    return hashlib.sha1(repr(setup)).hexdigest()[:16]
+
+
+# The MarkdownStore of the build, if DATASTORE['markdown_cache'] is set.
+markdown_store = [None]
+
+
+def configure_markdown_store(pelican_object):
+    """Open the store at DATASTORE['markdown_cache'], when Pelican starts.
+
+    i18n subsites with the same setting keep the store already open.
+    """
+    path = pelican_object.settings.get('DATASTORE', {}).get('markdown_cache')
+    store = markdown_store[0]
+    if not path:
+        markdown_store[0] = None
+    elif store is None or store.path != path:
+        markdown_store[0] = MarkdownStore(path, markdown_stamp())
+
+signal('pelican_initialized').connect(configure_markdown_store)
+
+
+def prune_markdown_store(pelican_object):
+    """Prune the store when the main site finishes, once per build.
+
+    i18n subsites, whose DEFAULT_LANG is one of I18N_SUBSITES, finish
+    their own runs within the main site's, and leave the store be.
+    """
+    settings = pelican_object.settings
+    if settings.get('DEFAULT_LANG') in settings.get('I18N_SUBSITES', {}):
+        return
+    store = markdown_store[0]
+    if store is not None:
+        store.prune()
+
+signal('pelican_finalized').connect(prune_markdown_store)
+
+
 markdown_cache = {}
 def markdown(content):
-    """Parse `content` as markdown."""
-    hash = hashlib.sha256(content.encode('ascii', 'replace')).hexdigest()
+    """Parse `content` as markdown.
+
+    Renders are cached in memory for the build, and in `markdown_store`
+    across builds, if it is configured.
+    """
+    hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
     if hash not in markdown_cache:
-        markdown_cache[hash] = jinja2.Markup(md.convert(content))
+        store = markdown_store[0]
+        html = store.get(hash) if store else None
+        if html is None:
+            html = md.reset().convert(content)
+            if store:
+                store.set(hash, html)
+        markdown_cache[hash] = jinja2.Markup(html)
     return markdown_cache[hash]
 
 
+class Query(object):
+    """A lazy, chained run of `where` and `natsort` over `items`.
+
+    Chaining only records conditions and sorts; the items are filtered in
+    a single pass, then sorted, the first time the query is read, and the
+    result is kept. If `items` has a `get_index(columns)` method (like the
+    rows of a datastore table), the most selective `==` condition is read
+    from an index instead of scanning. Filtering keeps order, so running
+    all conditions before the sorts gives the same result as the chain.
+
+    Queries read like lists: they iterate, index, slice, and have a length.
+    """
+
+    def __init__(self, items, conditions=(), sorts=()):
+        self.items = items
+        self.conditions = conditions
+        self.sorts = sorts
+        self._result = None
+
+    def where(self, key, value, op='=='):
+        return Query(self.items, self.conditions + ((key, op, value),),
+                     self.sorts)
+
+    def natsort(self, attribute, reverse=False):
+        return Query(self.items, self.conditions,
+                     self.sorts + ((attribute, reverse),))
+
+    def first(self, default=None):
+        """Return the first result, scanning no further if unsorted."""
+        result = self.head(1)
+        return result[0] if result else default
+
+    def head(self, n):
+        """Return the first `n` results.
+
+        A sorted query picks them with a heap, rather than sorting all of
+        its results.
+        """
+        if self._result is not None:
+            return self._result[:n]
+        if not self.sorts:
+            first = []
+            for item in self._filtered():
+                if len(first) == n:
+                    break
+                first.append(item)
+            return first
+        if len(self.sorts) > 1:
+            return self.all()[:n]
+
+        view = self._view()
+        if view is not None:
+            items, conditions = self._candidates()
+            if items is self.items:
+                return list(self._filtered(view.items, conditions, n))
+            return heapq.nsmallest(n, self._filtered(items, conditions),
+                                   key=view.position)
+        attribute, reverse = self.sorts[0]
+        pick = heapq.nlargest if reverse else heapq.nsmallest
+        return pick(n, self._filtered(),
+                    key=natsort_key(attribute))
+
+    def all(self):
+        """Return the results as a list, running the query once."""
+        if self._result is None:
+            view = self._view() if len(self.sorts) == 1 else None
+            if view is not None:
+                items, conditions = self._candidates()
+                if items is self.items:
+                    result = list(self._filtered(view.items, conditions))
+                else:
+                    result = sorted(self._filtered(items, conditions),
+                                    key=view.position)
+            else:
+                result = list(self._filtered())
+                for attribute, reverse in self.sorts:
+                    result = natsortlib.natsorted(
+                        result, key=operator.itemgetter(attribute),
+                        reverse=reverse)
+            self._result = result
+        return self._result
+
+    def _view(self):
+        """Return the cached SortedView of the source, if it has one.
+
+        Only long lived sources (those with indexes, like datastore rows)
+        get views, so pages' throwaway lists do not churn the cache.
+        """
+        if not hasattr(self.items, 'get_index'):
+            return None
+        attribute, reverse = self.sorts[0]
+        key = (cache_generation[0], id(self.items), attribute, reverse)
+        return sort_cache.get(
+            key, lambda: SortedView(self.items, attribute, reverse))
+
+    def _filtered(self, items=None, conditions=None, limit=None):
+        if items is None:
+            items, conditions = self._candidates()
+        tests = [(operator.itemgetter(key), operators[op], value) for
+                 key, op, value in conditions]
+        matches = (item for item in items if
+                   all(test(get(item), value) for get, test, value in tests))
+        if limit is not None:
+            return itertools.islice(matches, limit)
+        return matches
+
+    def _candidates(self):
+        """Return the items to scan, and the conditions left to test."""
+        get_index = getattr(self.items, 'get_index', None)
+        best = None
+        if get_index is not None:
+            for position, (key, op, value) in enumerate(self.conditions):
+                if op != '==':
+                    continue
+                try:
+                    bucket = get_index((key,))[value]
+                except (KeyError, TypeError):
+                    continue
+                if best is None or len(bucket) < len(best[1]):
+                    best = (position, bucket)
+        if best is None:
+            return self.items, self.conditions
+        position, bucket = best
+        return bucket, (self.conditions[:position] +
+                        self.conditions[position + 1:])
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def __len__(self):
+        return len(self.all())
+
+    def __nonzero__(self):
+        return self.first(_empty) is not _empty
+
+    def __getitem__(self, key):
+        return self.all()[key]
+
+    def __eq__(self, other):
+        if not isinstance(other, (Query, list, tuple)):
+            return NotImplemented
+        return self.all() == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<Query {0!r}>'.format(self.all())
+
+
+_empty = object()
+
+
+def natsort_key(attribute):
+    """Return the natural sort key natsort uses for `attribute`."""
+    return natsortlib.natsort_keygen(key=operator.itemgetter(attribute))
+
+
+class SortedView(object):
+    """The natural sort order of `items` on `attribute`, computed once.
+
+    `items` is the sorted list, and `position(item)` gives an item's place
+    in it, so subsets can be put in order without comparing natural keys.
+    Ties keep their order in the source, as with natsort.
+    """
+
+    def __init__(self, source, attribute, reverse=False):
+        self.source = source  # keeps the source, and so its id, alive
+        self.items = natsortlib.natsorted(
+            source, key=operator.itemgetter(attribute), reverse=reverse)
+        positions = dict((id(item), position) for
+                         position, item in enumerate(self.items))
+        self.position = lambda item: positions[id(item)]
+
+
+def query(iterable):
+    """Return `iterable` as a Query, to chain filters onto."""
+    if isinstance(iterable, Query):
+        return iterable
+    if not isinstance(iterable, (list, tuple)):
+        iterable = list(iterable)
+    return Query(iterable)
+
+
 def where(iterable, key, value, op='=='):
-    """Filter `iterable` of dicts on `key` where `key` `op` `value`"""
-    operator_func = operators[op]
-    return [o for o in iterable if operator_func(o[key], value)]
+    """Filter `iterable` of dicts on `key` where `key` `op` `value`
+
+    Returns a lazy Query, see above.
+    """
+    operators[op]  # fail here on an unknown operator, not when read
+    return query(iterable).where(key, value, op)
 
 
 def natsort(iterable, attribute=None, reverse=False):
-    """Like sort, but, all natural. For us, sorts strings as numbers."""
-    _key = operator.itemgetter(attribute)
-    return natsortlib.natsorted(iterable, key=_key, reverse=reverse)
+    """Like sort, but, all natural. For us, sorts strings as numbers.
+
+    Returns a lazy Query, see above.
+    """
+    return query(iterable).natsort(attribute, reverse)
+
+
+def top(iterable, n, attribute=None, reverse=False):
+    """Return the first `n` items of `iterable`, as natsort would order
+    them on `attribute`, or in their own order without one.
+
+    Picks them with a heap, rather than sorting every item.
+    """
+    items = query(iterable)
+    if attribute is not None:
+        items = items.natsort(attribute, reverse)
+    return items.head(n)
+
+
+class Groups(dict):
+    """Items grouped by key, see `group_by`. Missing keys give []."""
+
+    def __missing__(self, key):
+        return []
+
+
+class Lookup(dict):
+    """Items by unique key, see `lookup`. Missing keys give None."""
+
+    def __missing__(self, key):
+        return None
+
+
+def join_key(iterable):
+    """Return a cache key for `iterable`, or None if it should not be cached.
+
+    Only datastore rows (which have indexes), and queries over them, are
+    cached across pages: they live for the whole build. The key holds on
+    to them, so their ids are not reused while cached.
+    """
+    if isinstance(iterable, Query):
+        if not hasattr(iterable.items, 'get_index'):
+            return None
+        key = (iterable.items, id(iterable.items), iterable.conditions,
+               iterable.sorts)
+    elif hasattr(iterable, 'get_index'):
+        key = (iterable, id(iterable))
+    else:
+        return None
+    try:
+        hash(key[1:])
+    except TypeError:
+        return None
+    return key
+
+
+def group_by(iterable, *keys):
+    """Return a dict of the items of `iterable` by the value of `keys`.
+
+    Values are lists in iterable order; with more than one key, dict keys
+    are tuples. Lets a template join with one lookup per row, instead of a
+    `where` scan.
+    """
+    def build():
+        get = operator.itemgetter(*keys)
+        groups = Groups()
+        for item in iterable:
+            groups.setdefault(get(item), []).append(item)
+        return groups
+
+    return cached_join('group_by', iterable, keys, build)
+
+
+def lookup(iterable, key):
+    """Return a dict of the items of `iterable` by their unique `key`.
+
+    If the key is not unique, the first item wins, as with
+    `where(key, value)|first_or_default(None)`.
+    """
+    def build():
+        get = operator.itemgetter(key)
+        found = Lookup()
+        for item in iterable:
+            found.setdefault(get(item), item)
+        return found
+
+    return cached_join('lookup', iterable, (key,), build)
+
+
+def cached_join(kind, iterable, keys, build):
+    source = join_key(iterable)
+    if source is None:
+        return build()
+    cache_key = (cache_generation[0], kind, keys) + source[1:]
+    return join_cache.get(cache_key, lambda: (source[0], build()))[1]
 
 
 def tojson(content):
@@ -55,14 +494,79 @@ def debug(value):
     return ''
 
 
-search_cache = {}
+class IndexCache(object):
+    """A bounded cache of indexes, evicting the least recently used.
+
+    Keys should carry the datastore generation, so an index is never served
+    for data it was not built from. One cache serves the main site and every
+    i18n subsite; hits and misses are logged and reset by `report` at the
+    end of each build.
+    """
+
+    def __init__(self, name, maxsize=128):
+        self.name = name
+        self.maxsize = maxsize
+        self.indexes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def get(self, key, build):
+        """Return the index for `key`, calling `build()` to make it if new."""
+        if key in self.indexes:
+            self.hits += 1
+            index = self.indexes.pop(key)
+        else:
+            self.misses += 1
+            index = build()
+            if len(self.indexes) >= self.maxsize:
+                self.indexes.popitem(last=False)
+                self.evictions += 1
+        self.indexes[key] = index
+        return index
+
+    def clear(self):
+        self.indexes.clear()
+
+    def report(self, *args):
+        """Log hit/miss statistics since the last report, and reset them."""
+        logger.info('%s cache: %d hits, %d misses, %d evictions, '
+                    '%d kept', self.name, self.hits, self.misses,
+                    self.evictions, len(self.indexes))
+        self.hits = self.misses = self.evictions = 0
+
+
+search_cache = IndexCache('search')
+signal('pelican_finalized').connect(search_cache.report)
+
+# Sorted views of datastore rows, see Query._view.
+sort_cache = IndexCache('sort', maxsize=32)
+signal('pelican_finalized').connect(sort_cache.report)
+
+# Results of group_by and lookup over datastore rows, see join_key.
+join_cache = IndexCache('join', maxsize=256)
+signal('pelican_finalized').connect(join_cache.report)
+
+
 def search(items, namespace, **conditions):
-    """Return new filtered list.
+    """Return new filtered list, as a Query.
 
     Functions use cache to store indexed items.
     First time we index items using conditions,
     then we use indexed items to make fast searches.
+    Indexes are cached by the datastore generation, the namespace and the
+    identity of `items`, for datastore rows and queries over them only
+    (see join_key). Other lists are indexed again on every call.
     """
+    source = join_key(items)
+    if isinstance(items, Query):
+        items = items.all()
+    elif not isinstance(items, (list, tuple)):
+        items = list(items)
+
     # Caclculate outer hash
     outer_keys = sorted(conditions.keys())
     # It's like `<id>-place-year`
@@ -76,23 +580,40 @@ def search(items, namespace, **conditions):
     inner_hash = '-'.join(inner_keys)
 
     # Prepare indexed items
-    if outer_hash not in search_cache:
-        search_cache[outer_hash] = {}
+    def build():
+        index = {}
         for item in items:
             item_keys = []
             for outer_key in outer_keys:
                 item_keys.append(item[outer_key])
             # It's like `gb-2014`
             item_hash = '-'.join(item_keys)
-            store = search_cache[outer_hash].setdefault(item_hash, [])
-            store.append(item)
+            index.setdefault(item_hash, []).append(item)
+        return index
+
+    if source is None:
+        index = build()
+    else:
+        cache_key = (cache_generation[0], outer_hash) + source[1:]
+        index = search_cache.get(cache_key, lambda: (source[0], build()))[1]
+    return Query(index.get(inner_hash, ()))
 
-    return list(search_cache[outer_hash].get(inner_hash, []))
+
+def if_none(value, default):
+    """Return `value`, or `default` if value is None.
+
+    Unlike `value or default`, keeps falsy values like a score of 0.
+    """
+    if value is None or isinstance(value, jinja2.Undefined):
+        return default
+    return value
 
 
 def first_or_default(items, default):
     """Return first item or default if items is empty.
     """
+    if isinstance(items, Query):
+        return items.first(default)
     if items:
         return items[0]
     return default